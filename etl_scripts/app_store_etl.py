@@ -1,10 +1,14 @@
 import pandas as pd
+import hashlib
 from datetime import date
 from app_store_scraper import AppStore
 import os
 import logging
-import sqlite3
 from pathlib import Path
+from etl_scripts.watermarks import get_watermark, set_watermark, merge_incremental
+from etl_scripts.storage import save_parquet
+from etl_scripts.exports import schedule_exports
+from etl_scripts.schema import apply_review_schema
 
 # -------------------------------
 # LOGGING SETUP
@@ -28,11 +32,30 @@ logger = logging.getLogger(__name__)
 # RAW DATA FUNCTION
 # ------------------------------------
 
-def Raw_Reviews(app_name, app_id, country='us', n=10000):
+def add_review_ids(df):
+    """App Store reviews carry no id, so derive a stable one from date, author and title"""
+    if df.empty:
+        return df
+    keys = pd.to_datetime(df['date']).astype(str) + '|' + df['userName'].astype(str) + '|' + df['title'].astype(str)
+    df['review_id'] = keys.map(lambda key: hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+    return df
+
+def Raw_Reviews(app_name, app_id, country='us', n=10000, since=None):
+    """
+    Fetch up to n App Store reviews, keeping those at or after the watermark since.
+
+    Incremental on storage only, not on the network: app_store_scraper applies
+    after= client-side while it keeps paging up to how_many, and the reviews endpoint
+    makes no ordering guarantee to stop on. Every run therefore downloads up to n
+    reviews; only the ones not seen before are merged and exported.
+    """
     logger.info(f"🔄 Starting raw review fetch for {app_name}")
     try:
         app = AppStore(country=country, app_name=app_name, app_id=app_id)
-        app.review(how_many=n)
+        app.review(how_many=n, after=since)
+        if since is not None:
+            logger.info(f"Fetched {len(app.reviews)} App Store reviews for {app_name}; the scraper pages up to {n} "
+                        f"reviews regardless of the watermark, which is applied after download")
         df = pd.DataFrame(app.reviews)
 
         if 'date' in df.columns:
@@ -42,6 +65,14 @@ def Raw_Reviews(app_name, app_id, country='us', n=10000):
             df = df[(df['date'] >= last_year) & (df['date'] <= today)]
             df = df.sort_values(by='date', ascending=True).reset_index(drop=True)
 
+            # Keep reviews from the previous run's watermark on; ones sharing its timestamp
+            # are kept too and deduplicated by merge_incremental
+            if since is not None:
+                df = df[df['date'] >= since].reset_index(drop=True)
+                logger.info(f"{len(df)} App Store reviews for {app_name} are at or after watermark {since}")
+
+            df = add_review_ids(df)
+
         return df
     except Exception as e:
         logger.error(f"❌ Error in Raw_Reviews for {app_name}: {str(e)}")
@@ -51,41 +82,20 @@ def Raw_Reviews(app_name, app_id, country='us', n=10000):
 # SAVE RAW DATA FUNCTION
 # ------------------------------------
 
-def save_raw_data(df, app_path):
-    """Save the raw data to the raw data folder in multiple formats (CSV, Excel, SQLite)"""
+def save_raw_data(df, app_path, new_rows=None):
+    """Save the raw data to the raw data folder as Parquet, with CSV, Excel and SQLite exports"""
     # Create directory structure if it doesn't exist using Path
     data_dir = Path(__file__).parent.parent / 'data' / app_path / 'raw_data'
     data_dir.mkdir(parents=True, exist_ok=True)
     
-    # 1. Save to CSV
-    csv_file = data_dir / 'app_store.csv'
-    df.to_csv(csv_file, index=False)
-    logger.info(f"Raw data saved to CSV: {csv_file}")
-    
-    # 2. Save to Excel
-    excel_file = data_dir / 'app_store.xlsx'
-    df.to_excel(excel_file, index=False)
-    logger.info(f"Raw data saved to Excel: {excel_file}")
+    # 1. Save to Parquet (canonical copy read by downstream stages)
+    parquet_file = save_parquet(df, data_dir / 'app_store.parquet')
+    logger.info(f"Raw data saved to Parquet: {parquet_file}")
     
-    # 3. Save to SQLite
-    sqlite_file = data_dir / 'app_store.db'
-    conn = sqlite3.connect(sqlite_file)
-    
-    # Convert timestamp_dt to string to avoid SQLite datetime issues
-    df_sqlite = df.copy()
-    if 'timestamp_dt' in df_sqlite.columns:
-        df_sqlite['timestamp_dt'] = df_sqlite['timestamp_dt'].astype(str)
-    
-    try:
-        # Create a table 'raw_data' and save the dataframe
-        df_sqlite.to_sql('raw_data', conn, if_exists='replace', index=False)
-        logger.info(f"Raw data saved to SQLite database: {sqlite_file}")
-    except Exception as e:
-        logger.error(f"Error saving to SQLite: {e}")
-    finally:
-        conn.close()
+    # 2. CSV, Excel and SQLite copies are written by the export worker
+    schedule_exports(parquet_file, 'raw_data', new_rows=new_rows)
     
-    return str(csv_file)
+    return str(parquet_file)
 
 # ------------------------------------
 # PROCESSED DATA FUNCTION
@@ -98,14 +108,14 @@ def Processed_Reviews(df_raw: pd.DataFrame, app_name: str):
             logger.warning(f"⚠️ No valid data to process for {app_name}")
             return pd.DataFrame()
 
-        df_clean = df_raw.rename(columns={"date": "review_datetime"})
-        df_clean = df_clean[["review_datetime", "review", "rating"]].copy()
+        df_clean = df_raw.rename(columns={"date": "review_datetime", "rating": "app_rating"})
+        df_clean = df_clean[["review_datetime", "review", "app_rating", "review_id"]].copy()
         df_clean.dropna(subset=["review_datetime", "review"], inplace=True)
 
         df_clean["data_source"] = "App Store"
         df_clean["app_name"] = app_name
 
-        return df_clean
+        return apply_review_schema(df_clean)
     except Exception as e:
         logger.error(f" Error in Processed_Reviews for {app_name}: {str(e)}")
         return pd.DataFrame()
@@ -114,42 +124,20 @@ def Processed_Reviews(df_raw: pd.DataFrame, app_name: str):
 # SAVE PROCESSED DATA FUNCTION
 # ------------------------------------
 
-def save_processed_data(df, app_path):
-    """Save the processed data to the processed data folder in multiple formats (CSV, Excel, SQLite)"""
+def save_processed_data(df, app_path, new_rows=None):
+    """Save the processed data to the processed data folder as Parquet, with CSV, Excel and SQLite exports"""
     # Create directory structure if it doesn't exist using Path
     data_dir = Path(__file__).parent.parent / 'data' / app_path / 'processed_data'
     data_dir.mkdir(parents=True, exist_ok=True)
     
-    # 1. Save to CSV
-    csv_file = data_dir / 'app_store.csv'
-    df.to_csv(csv_file, index=False)
-    logger.info(f"Processed data saved to CSV: {csv_file}")
+    # 1. Save to Parquet (canonical copy read by downstream stages)
+    parquet_file = save_parquet(df, data_dir / 'app_store.parquet')
+    logger.info(f"Processed data saved to Parquet: {parquet_file}")
     
-    # 2. Save to Excel
-    excel_file = data_dir / 'app_store.xlsx'
-    df.to_excel(excel_file, index=False)
-    logger.info(f"Processed data saved to Excel: {excel_file}")
+    # 2. CSV, Excel and SQLite copies are written by the export worker
+    schedule_exports(parquet_file, 'processed_data', new_rows=new_rows)
     
-    # 3. Save to SQLite
-    sqlite_file = data_dir / 'app_store.db'
-    conn = sqlite3.connect(sqlite_file)
-    
-    # Convert datetime columns to string to avoid SQLite datetime issues
-    df_sqlite = df.copy()
-    for col in df_sqlite.columns:
-        if pd.api.types.is_datetime64_any_dtype(df_sqlite[col]):
-            df_sqlite[col] = df_sqlite[col].astype(str)
-    
-    try:
-        # Create a table 'processed_data' and save the dataframe
-        df_sqlite.to_sql('processed_data', conn, if_exists='replace', index=False)
-        logger.info(f"Processed data saved to SQLite database: {sqlite_file}")
-    except Exception as e:
-        logger.error(f"Error saving processed data to SQLite: {e}")
-    finally:
-        conn.close()
-    
-    return str(csv_file)
+    return str(parquet_file)
 
 # ------------------------------------
 # SANITY CHECKS FUNCTION
@@ -174,11 +162,23 @@ def sanity_checks(df: pd.DataFrame, context: str = ""):
 # MAIN WRAPPER FUNCTION
 # ------------------------------------
 
-def main(app_name: str, app_path: str, app_id: int, review_count: int = 1000, country: str = 'us'):
+def main(app_name: str, app_path: str, app_id: int, review_count: int = 1000, country: str = 'us', incremental: bool = True):
+    """Run the App Store ETL for one app; returns True on success and raises on failure"""
     logger.info(f"🚀 Starting ETL pipeline for {app_name}")
 
+    watermark = get_watermark(app_path, 'app_store') if incremental else None
+    since = watermark['newest_timestamp'] if watermark else None
+
     # Run raw ETL
-    df_raw = Raw_Reviews(app_name, app_id, country, n=review_count)
+    df_new = Raw_Reviews(app_name, app_id, country, n=review_count, since=since)
+    df_raw = df_new
+
+    # Merge the new reviews into the previously extracted raw data
+    if incremental:
+        existing_path = Path(__file__).parent.parent / 'data' / app_path / 'raw_data' / 'app_store.csv'
+        df_raw = merge_incremental(df_new, existing_path, ['date', 'userName', 'title'], 'date', ascending=True)
+        # Rows extracted before review ids existed get theirs here
+        df_raw = add_review_ids(df_raw)
     
     # --- SANITY CHECK raw data ---
     sanity_checks(df_raw, context="Raw Data")
@@ -189,7 +189,8 @@ def main(app_name: str, app_path: str, app_id: int, review_count: int = 1000, co
     assert len(df_raw) >= 5, f" Raw DataFrame has too few rows: {len(df_raw)}"
 
     # Save raw data in multiple formats
-    save_raw_data(df_raw, app_path)
+    # On incremental runs only the new rows need to reach the SQLite export
+    save_raw_data(df_raw, app_path, new_rows=df_new if incremental else None)
     
     # Process the raw data
     df_processed = Processed_Reviews(df_raw, app_name)
@@ -203,9 +204,16 @@ def main(app_name: str, app_path: str, app_id: int, review_count: int = 1000, co
     assert len(df_processed) >= 5, f" Processed DataFrame has too few rows: {len(df_processed)}"
 
     # Save processed data in multiple formats
-    save_processed_data(df_processed, app_path)
+    processed_delta = None
+    if incremental:
+        new_ids = df_new['review_id'] if 'review_id' in df_new.columns else []
+        processed_delta = df_processed[df_processed['review_id'].isin(new_ids)]
+    save_processed_data(df_processed, app_path, new_rows=processed_delta)
+
+    set_watermark(app_path, 'app_store', df_raw['date'].max())
 
     logger.info(f"Finished ETL pipeline for {app_name}")
+    return True
 
     
 
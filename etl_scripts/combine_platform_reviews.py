@@ -1,7 +1,9 @@
-import pandas as pd
+import itertools
 import logging
 from datetime import datetime
 from pathlib import Path
+from etl_scripts.storage import iter_dataset, dataset_exists, write_chunks
+from etl_scripts.schema import REVIEW_COLUMNS, apply_review_schema, review_arrow_schema
 
 def setup_logging(base_dir):
     """Set up logging configuration."""
@@ -20,84 +22,80 @@ def setup_logging(base_dir):
     )
     logging.info(f"Logging initialized. Log file: {log_file}")
 
-# Define final column order
-FINAL_COLUMNS = ['review', 'review_datetime', 'data_source', 'app_name',
-                 'upvote_count', 'total_comments', 'app_rating']
+# Define final column order and the Parquet schema every appended chunk must match
+FINAL_COLUMNS = REVIEW_COLUMNS
+FINAL_SCHEMA = review_arrow_schema(FINAL_COLUMNS)
 
-def load_and_standardize(file_path, source_name):
-    """Load a CSV file and standardize its columns to match the final format."""
-    try:
-        if not file_path.exists():
-            logging.warning(f"File not found: {file_path}")
-            return pd.DataFrame(columns=FINAL_COLUMNS)
-        
-        df = pd.read_csv(file_path)
-        logging.info(f"Loaded {len(df)} records from {file_path}")
-        
-        # Add missing columns with None
-        for col in FINAL_COLUMNS:
-            if col not in df.columns:
-                df[col] = None
-                logging.info(f"Added missing column '{col}' to {source_name} data")
-        
-        # Reorder columns
-        df = df[FINAL_COLUMNS]
-        return df
-    
-    except Exception as e:
-        logging.error(f"Error loading {file_path}: {str(e)}")
-        return pd.DataFrame(columns=FINAL_COLUMNS)
+# Rows read from a source at a time; memory use depends on this, not on history size
+CHUNK_SIZE = 50000
+
+SOURCES = ['reddit', 'google_play', 'app_store']
+
+def standardize_chunk(df):
+    """Normalize a chunk of any source to FINAL_COLUMNS with the review model's dtypes."""
+    return apply_review_schema(df, FINAL_COLUMNS)
+
+def stream_standardized(file_path, source_name, chunk_size=CHUNK_SIZE):
+    """Yield a source dataset (Parquet, falling back to CSV) in standardized chunks."""
+    if not dataset_exists(file_path):
+        logging.warning(f"File not found: {file_path}")
+        return
+    for chunk in iter_dataset(file_path, chunk_size, columns=FINAL_COLUMNS):
+        yield standardize_chunk(chunk)
 
-def combine_reviews_for_platform(base_dir, app_path):
-    """Combine reviews from multiple sources for a single platform."""
+def combine_reviews_for_platform(base_dir, app_path, chunk_size=CHUNK_SIZE):
+    """
+    Combine reviews from multiple sources for a single platform.
+
+    Sources are streamed chunk by chunk into the Parquet and CSV outputs with
+    write_chunks, so only one chunk is held in memory at a time and the outputs are
+    swapped in once complete.
+    """
+    processed_dir = base_dir / 'data' / app_path / 'processed_data'
+    parquet_output = processed_dir / 'combined_reviews.parquet'
+    csv_output = processed_dir / 'combined_reviews.csv'
     try:
-        processed_dir = base_dir / 'data' / app_path / 'processed_data'
         processed_dir.mkdir(parents=True, exist_ok=True)
         
         logging.info(f"Processing platform: {app_path}")
-        
-        # Define source file paths
-        reddit_path = processed_dir / 'reddit.csv'
-        google_path = processed_dir / 'google_play.csv'
-        app_store_path = processed_dir / 'app_store.csv'
 
-        # Load and standardize data
-        reddit_df = load_and_standardize(reddit_path, 'reddit')
-        google_df = load_and_standardize(google_path, 'google_play')
-        app_store_df = load_and_standardize(app_store_path, 'app_store')
+        stats = {source: 0 for source in SOURCES}
 
-        combined_df = pd.concat([reddit_df, google_df, app_store_df], ignore_index=True)
-        
-        # Check if we have any data
-        if combined_df.empty:
+        def chunks():
+            for source in SOURCES:
+                # Parquet copy is preferred; the CSV path is the fallback for older data
+                for chunk in stream_standardized(processed_dir / f'{source}.csv', source, chunk_size):
+                    stats[source] += len(chunk)
+                    yield chunk
+
+        # Check if we have any data before replacing the previous outputs
+        stream = chunks()
+        first = next(stream, None)
+        if first is None:
             logging.warning(f"No data found for {app_path}")
             return False
 
-        # Create stats for logging
-        stats = {
-            'Total reviews': len(combined_df),
-            'Reddit reviews': len(reddit_df),
-            'Google Play reviews': len(google_df),
-            'App Store reviews': len(app_store_df)
-        }
-        logging.info(f"Statistics for {app_path}: {stats}")
+        # Parquet is the canonical copy; the CSV is kept for the notebooks
+        total = write_chunks(itertools.chain([first], stream), parquet_output, csv_output, FINAL_SCHEMA)
 
-        output_path = processed_dir / 'combined_reviews.csv'
-        combined_df.to_csv(output_path, index=False)
+        # Create stats for logging
+        logging.info(f"Statistics for {app_path}: {{'Total reviews': {total}, 'Reddit reviews': {stats['reddit']}, "
+                     f"'Google Play reviews': {stats['google_play']}, 'App Store reviews': {stats['app_store']}}}")
         
-        logging.info(f"SUCCESS: Combined reviews saved for {app_path} at {output_path}")
+        logging.info(f"SUCCESS: Combined reviews saved for {app_path} at {csv_output}")
         return True
         
     except Exception as e:
         logging.error(f"Error processing platform {app_path}: {str(e)}")
         return False
 
-def main(app_path):
+def main(app_path, chunk_size=CHUNK_SIZE):
     """
     Main function to combine reviews for a specific platform.
     
     Args:
         app_path (str): The name of the platform to process (e.g., 'uber_eats').
+        chunk_size (int): Rows read from each source at a time.
     
     Returns:
         bool: True if processing was successful, False otherwise.
@@ -111,7 +109,7 @@ def main(app_path):
         logging.info(f"Starting review combination process for {app_path} from base directory: {base_dir}")
         
         # Process the specified platform
-        return combine_reviews_for_platform(base_dir, app_path)
+        return combine_reviews_for_platform(base_dir, app_path, chunk_size)
     except Exception as e:
         print(f"Critical error in main function: {str(e)}")
         logging.critical(f"Critical error in main function: {str(e)}")
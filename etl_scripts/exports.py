@@ -0,0 +1,197 @@
+"""
+Secondary export formats (CSV, Excel, SQLite, warehouse) generated from the canonical Parquet copy.
+
+Which formats each stage exports, and whether exports run inline, on a background
+worker or only on demand, is configured under `exports` in config/config.yaml.
+Run on demand with:
+
+    python -m etl_scripts.exports data/doordash/raw_data/reddit.parquet --formats excel
+"""
+
+import sys
+import sqlite3
+import logging
+import argparse
+import threading
+import yaml
+import pandas as pd
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from etl_scripts.sqlite_store import TABLE_SCHEMAS, upsert_dataframe
+from etl_scripts.warehouse import load_into_warehouse
+
+logger = logging.getLogger('exports')
+
+config_path = Path(__file__).parent.parent / 'config' / 'config.yaml'
+
+DEFAULT_EXPORT_CONFIG = {
+    'mode': 'background',  # inline, background or on_demand
+    'workers': 1,
+    'raw_data': ['csv', 'excel', 'warehouse'],
+    'processed_data': ['csv', 'excel', 'warehouse'],
+}
+
+# ───────────────────────────────────────────────────────────── #
+# FORMAT REGISTRY
+# ───────────────────────────────────────────────────────────── #
+
+EXPORTERS = {}
+
+def register_exporter(name):
+    """
+    Register a function(df, path, table_name, new_rows) that writes one export format.
+
+    new_rows, when given, holds just the rows added or changed by this run, for
+    formats that can be updated in place.
+    """
+    def decorator(func):
+        EXPORTERS[name] = func
+        return func
+    return decorator
+
+@register_exporter('csv')
+def export_csv(df, path, table_name, new_rows=None):
+    csv_file = path.with_suffix('.csv')
+    df.to_csv(csv_file, index=False)
+    return csv_file
+
+@register_exporter('excel')
+def export_excel(df, path, table_name, new_rows=None):
+    excel_file = path.with_suffix('.xlsx')
+    df.to_excel(excel_file, index=False)
+    return excel_file
+
+@register_exporter('sqlite')
+def export_sqlite(df, path, table_name, new_rows=None):
+    sqlite_file = path.with_suffix('.db')
+    schema = TABLE_SCHEMAS.get((path.stem, table_name))
+
+    if schema is None:
+        # No declared key for this dataset, so rewrite the table wholesale
+        df_sqlite = df.copy()
+        for col in df_sqlite.columns:
+            if pd.api.types.is_datetime64_any_dtype(df_sqlite[col]):
+                df_sqlite[col] = df_sqlite[col].astype(str)
+        conn = sqlite3.connect(sqlite_file)
+        try:
+            df_sqlite.to_sql(table_name, conn, if_exists='replace', index=False)
+        finally:
+            conn.close()
+        return sqlite_file
+
+    if new_rows is not None and sqlite_file.exists():
+        # Incremental run: upsert only the new rows and drop what fell out of the window
+        datetime_column = schema['datetime_column']
+        prune = (datetime_column, df[datetime_column].min()) if datetime_column in df.columns and not df.empty else None
+        upsert_dataframe(sqlite_file, table_name, new_rows, schema['key'], schema['indexes'], prune=prune)
+    else:
+        upsert_dataframe(sqlite_file, table_name, df, schema['key'], schema['indexes'], replace=True)
+    return sqlite_file
+
+@register_exporter('warehouse')
+def export_warehouse(df, path, table_name, new_rows=None):
+    # Datasets live at data/<app_path>/<stage>/<platform>.parquet
+    return load_into_warehouse(df, path.parent.parent.name, path.stem, table_name, new_rows=new_rows)
+
+# ───────────────────────────────────────────────────────────── #
+# CONFIG
+# ───────────────────────────────────────────────────────────── #
+
+_export_config = None
+
+def load_export_config():
+    """Load the `exports` section of config.yaml, filled in with defaults"""
+    global _export_config
+    if _export_config is None:
+        export_config = dict(DEFAULT_EXPORT_CONFIG)
+        try:
+            with open(config_path, 'r') as file:
+                export_config.update((yaml.safe_load(file) or {}).get('exports') or {})
+        except Exception as e:
+            logger.error(f"Error loading export config, using defaults: {e}")
+        _export_config = export_config
+    return _export_config
+
+# ───────────────────────────────────────────────────────────── #
+# EXPORT WORKER
+# ───────────────────────────────────────────────────────────── #
+
+_executor = None
+_pending = []
+_pending_lock = threading.Lock()
+
+def export_dataset(parquet_file, formats, table_name, new_rows=None):
+    """Write the requested formats next to a Parquet dataset; returns the files written"""
+    parquet_file = Path(parquet_file)
+    df = pd.read_parquet(parquet_file)
+
+    written = []
+    for name in formats:
+        exporter = EXPORTERS.get(name)
+        if exporter is None:
+            logger.error(f"Unknown export format '{name}' for {parquet_file}")
+            continue
+        try:
+            written.append(exporter(df, parquet_file, table_name, new_rows=new_rows))
+            logger.info(f"Exported {parquet_file.name} as {name}: {written[-1]}")
+        except Exception as e:
+            logger.error(f"Error exporting {parquet_file} as {name}: {e}")
+    return written
+
+def schedule_exports(parquet_file, stage, new_rows=None):
+    """
+    Produce the configured exports for a stage ('raw_data' or 'processed_data').
+
+    Pass new_rows on incremental runs so formats that support it only apply the delta.
+
+    In background mode this returns immediately and the exports are written by the
+    export worker; call wait_for_exports() before the process exits.
+    """
+    global _executor
+    export_config = load_export_config()
+    formats = export_config.get(stage) or []
+    mode = export_config.get('mode', 'background')
+
+    if not formats or mode == 'on_demand':
+        return None
+    if mode == 'inline':
+        return export_dataset(parquet_file, formats, stage, new_rows)
+
+    with _pending_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, export_config.get('workers', 1)), thread_name_prefix='export')
+        future = _executor.submit(export_dataset, parquet_file, formats, stage, new_rows)
+        _pending.append(future)
+    return future
+
+def wait_for_exports():
+    """Block until every scheduled background export has been written"""
+    with _pending_lock:
+        futures = list(_pending)
+        _pending.clear()
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            logger.error(f"Background export failed: {e}")
+    if futures:
+        logger.info(f"Finished {len(futures)} background exports")
+
+# ───────────────────────────────────────────────────────────── #
+# MAIN
+# ───────────────────────────────────────────────────────────── #
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Parquet datasets to other formats")
+    parser.add_argument('parquet_files', nargs='+', help="Parquet datasets to export")
+    parser.add_argument('--formats', nargs='+', default=['csv', 'excel', 'warehouse'], choices=sorted(EXPORTERS))
+    args = parser.parse_args(argv)
+
+    for parquet_file in args.parquet_files:
+        # Table name follows the stage folder the dataset lives in
+        export_dataset(parquet_file, args.formats, Path(parquet_file).parent.name)
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
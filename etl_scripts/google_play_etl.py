@@ -1,12 +1,15 @@
 # etl_scripts/google_play_etl.py
 import os
 import pandas as pd
-from google_play_scraper import Sort, reviews_all
+from google_play_scraper import Sort, reviews
 from datetime import datetime
 import logging
 from datetime import datetime, timedelta
 import random
-import sqlite3
+from etl_scripts.watermarks import get_watermark, set_watermark, merge_incremental
+from etl_scripts.storage import save_parquet
+from etl_scripts.exports import schedule_exports
+from etl_scripts.schema import apply_review_schema
 
 
 try:
@@ -43,36 +46,75 @@ logging.info("test log message")
 
 ###### EXTRACTION ########
 
-def extract_reviews(app_id: str, lang: str = "en", country: str = "us") -> pd.DataFrame:
+# Columns returned by google_play_scraper for each review
+REVIEW_COLUMNS = ['reviewId', 'userName', 'userImage', 'content', 'score', 'thumbsUpCount',
+                  'reviewCreatedVersion', 'at', 'replyContent', 'repliedAt', 'appVersion']
+
+def iter_review_pages(app_id: str, stop_at: datetime, lang: str = "en", country: str = "us", page_size: int = 200):
+    """Yield pages of reviews at or after stop_at, newest first, until a page reaches older reviews"""
+    continuation_token = None
+    page_number = 0
+
+    while True:
+        result, continuation_token = reviews(
+            app_id,
+            lang=lang,
+            country=country,
+            sort=Sort.NEWEST,
+            count=page_size,
+            continuation_token=continuation_token,
+        )
+        if not result:
+            break
+
+        page_number += 1
+        page = pd.DataFrame(result)
+        page['at'] = pd.to_datetime(page['at'])
+        # Timestamps have second resolution, so reviews sharing stop_at's second are kept
+        # (and paging continues past them); duplicates are dropped by reviewId later
+        reached_cutoff = page['at'].min() < stop_at
+
+        page = page[page['at'] >= stop_at]
+        if not page.empty:
+            yield page
+
+        # Results are sorted newest first, so nothing after this page is needed
+        if reached_cutoff or continuation_token is None or continuation_token.token is None:
+            logging.info(f"Stopped paging {app_id} after {page_number} pages (cutoff {stop_at})")
+            break
+
+def extract_reviews(app_id: str, lang: str = "en", country: str = "us", since: datetime = None,
+                    last_seen_id: str = None) -> pd.DataFrame:
     
     logging.info(f"Extracting reviews for {app_id}")
     #print(f"Extracting reviews for {app_id}")
-    reviews = reviews_all(
-        app_id,
-        sleep_milliseconds=0,
-        lang=lang,
-        country=country,
-        sort=Sort.NEWEST,
-    )
-    df = pd.DataFrame(reviews)
-
-    logging.info(f"Extracted {len(df)} reviews for {app_id}")
-    #print(f"Extracted {len(df)} reviews for {app_id}")
-
-    # Assuming df is your DataFrame
-    df['at'] = pd.to_datetime(df['at'])
-    
+
     # Calculate one year ago from the current date/time
     one_year_ago = datetime.now() - timedelta(days=365)
-    
-    # Filter for reviews from the past year
-    df = df[df['at'] >= one_year_ago]
-    
-    # Optional: Reset index
-    df = df.reset_index(drop=True)
-    
-    logging.info(f"Extracted {len(df)} reviews for {app_id} in last 1 year ({one_year_ago})")
-    #print(f"Extracted {len(df)} reviews for {app_id} in last 1 year ({one_year_ago})")
+
+    # Stop paging at the previous run's watermark, or at one year ago on a full extraction
+    stop_at = max(one_year_ago, since) if since is not None else one_year_ago
+
+    # Filter each page as it arrives; paging stops at the first page reaching stop_at
+    pages = []
+    extracted = 0
+    for page in iter_review_pages(app_id, stop_at, lang=lang, country=country):
+        # The review the watermark was taken from was stored by the previous run
+        if last_seen_id is not None:
+            page = page[page['reviewId'] != last_seen_id]
+        if not page.empty:
+            pages.append(page)
+            extracted += len(page)
+            logging.info(f"Fetched {extracted} reviews for {app_id} so far")
+
+    if pages:
+        df = pd.concat(pages, ignore_index=True)
+    else:
+        df = pd.DataFrame(columns=REVIEW_COLUMNS)
+        df['at'] = pd.to_datetime(df['at'])
+
+    logging.info(f"Extracted {len(df)} reviews for {app_id} from {stop_at} on")
+    #print(f"Extracted {len(df)} reviews for {app_id} newer than {stop_at}")
     
     return df
 
@@ -86,6 +128,7 @@ def transform_reviews(df: pd.DataFrame, app_name:str) -> pd.DataFrame:
         'score': 'app_rating',
         'thumbsUpCount': 'upvote_count',
         'at': 'review_datetime',
+        'reviewId': 'review_id',
     })
 
     ## Handle null/missing values
@@ -98,9 +141,10 @@ def transform_reviews(df: pd.DataFrame, app_name:str) -> pd.DataFrame:
     df['upvote_count'] = df['upvote_count'].fillna(0)
     
     ## rearrange the df
-    df = df[['review', 'review_datetime',  'upvote_count', 'app_rating']]
+    df = df[['review', 'review_datetime',  'upvote_count', 'app_rating', 'review_id']].copy()
     df['data_source'] = "Google Play"
     df['app_name'] = app_name
+    df = apply_review_schema(df)
 
     logging.info("Transformation complete.")
     #print("Transformation complete")
@@ -112,64 +156,65 @@ def transform_reviews(df: pd.DataFrame, app_name:str) -> pd.DataFrame:
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
-def load_reviews(df: pd.DataFrame, app_path: str, path: str):
+def load_reviews(df: pd.DataFrame, app_path: str, path: str, new_rows: pd.DataFrame = None):
     # Define base directory relative to parent (../data/...)
     base_dir = os.path.join(BASE_DIR, "data", app_path.lower(), path)
     os.makedirs(base_dir, exist_ok=True)
 
-    # Save as CSV
-    csv_path = os.path.join(base_dir, "google_play.csv")
-    df.to_csv(csv_path, index=False)
-    logging.info(f"Saved {path} reviews to CSV: {csv_path}")
-
-    # Save as Excel
-    excel_path = os.path.join(base_dir, "google_play.xlsx")
-    df.to_excel(excel_path, index=False)
-    logging.info(f"Saved {path} reviews to Excel: {excel_path}")
-
-    # Save to SQLite
-    db_path = os.path.join(base_dir, "google_play.db")
-    conn = sqlite3.connect(db_path)
+    # Save as Parquet (canonical copy read by downstream stages)
+    parquet_file = save_parquet(df, os.path.join(base_dir, "google_play.parquet"))
+    logging.info(f"Saved {path} reviews to Parquet: {parquet_file}")
 
-    df_sqlite = df.copy()
-    if 'review_datetime' in df_sqlite.columns:
-        df_sqlite['review_datetime'] = df_sqlite['review_datetime'].astype(str)
-
-    try:
-        df_sqlite.to_sql(path, conn, if_exists='replace', index=False)
-        logging.info(f"{path} saved to SQLite database: {db_path}")
-    except Exception as e:
-        logging.error(f"Error saving {path} to SQLite: {e}")
-    finally:
-        conn.close()
+    # CSV, Excel and SQLite copies are written by the export worker
+    schedule_exports(parquet_file, path, new_rows=new_rows)
 
     logging.info("===== DATA LOADING COMPLETE =====")
-    logging.info(f"Saved {len(df)} records in CSV, Excel and SQLite formats.")
+    logging.info(f"Saved {len(df)} records to Parquet.")
+
+    return str(parquet_file)
 
 
 
 
 ########## MAIN ##########
 
-def main(app_id: str, app_path: str, app_name: str):
+def main(app_id: str, app_path: str, app_name: str, incremental: bool = True) -> bool:
+    """Run the Google Play ETL for one app; returns True on success"""
     try:
         logging.info(f"ETL started for {app_name}")
 
-        df_raw = extract_reviews(app_id)
+        watermark = get_watermark(app_path, "google_play") if incremental else None
+        since = watermark['newest_timestamp'] if watermark else None
+        last_seen_id = watermark['last_seen_id'] if watermark else None
+
+        df_new = extract_reviews(app_id, since=since, last_seen_id=last_seen_id)
         logging.info(f"Raw {app_name} data extracted")
 
-        load_reviews(df_raw, app_path, "raw_data")
+        # Merge the new reviews into the previously extracted raw data
+        existing_path = os.path.join(BASE_DIR, "data", app_path.lower(), "raw_data", "google_play.csv")
+        df_raw = merge_incremental(df_new, existing_path, ['reviewId'], 'at') if incremental else df_new
+
+        # On incremental runs only the new rows need to reach the SQLite export
+        raw_delta = df_new if incremental else None
+        load_reviews(df_raw, app_path, "raw_data", new_rows=raw_delta)
         logging.info(f"Raw {app_name} files placed")
 
         df_clean = transform_reviews(df_raw, app_name)
         logging.info("Data cleaned and transformed")
 
-        load_reviews(df_clean, app_path, "processed_data")
+        processed_delta = df_clean[df_clean['review_id'].isin(df_new['reviewId'])] if incremental else None
+        load_reviews(df_clean, app_path, "processed_data", new_rows=processed_delta)
         logging.info(f"Processed {app_name} files placed")
 
+        if not df_raw.empty:
+            newest = df_raw.loc[df_raw['at'].idxmax()]
+            set_watermark(app_path, "google_play", newest['at'], newest['reviewId'])
+
         logging.info(f"ETL completed for {app_name}")
+        return True
 
     except Exception as e:
         logging.error(f"Error processing {app_name}: {e}")
+        return False
 
 
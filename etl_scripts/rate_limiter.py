@@ -0,0 +1,62 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger('rate_limiter')
+
+class TokenBucket:
+    """
+    Async token bucket shared by every coroutine that talks to one API.
+
+    Tokens refill continuously at rate_per_minute. When the API reports its own budget
+    (requests remaining and seconds until the window resets), the bucket switches to
+    that pace so the full quota is used without going over it.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.configured_rate = rate_per_minute / 60.0
+        self.rate = self.configured_rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 10.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.total_requests = 0
+        self.total_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a request may be sent"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    self.total_requests += 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.total_wait += wait
+                await asyncio.sleep(wait)
+
+    def update_from_headers(self, remaining, reset_seconds):
+        """Adapt to the budget reported by the API for the current window"""
+        if remaining is None or reset_seconds is None:
+            return
+        reset_seconds = max(float(reset_seconds), 1.0)
+        remaining = max(float(remaining), 0.0)
+
+        self._refill()
+        self._tokens = min(self._tokens, remaining)
+        # Spread what is left evenly over the rest of the window; when the budget is
+        # exhausted, the next token arrives just as the window resets
+        self.rate = max(remaining, 1.0) / reset_seconds
+
+    def pause(self, seconds):
+        """Stop handing out tokens for the given number of seconds (e.g. after a 429)"""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+        self.rate = 1.0 / max(float(seconds), 1.0)
+        logger.warning(f"Rate limited by the API, pausing requests for {seconds:.0f} seconds")
@@ -1,14 +1,23 @@
 import os
+import re
 import time
 import asyncio
 import asyncpraw
+import asyncprawcore
 import pandas as pd
 import logging
 import yaml
-import sqlite3
+from collections import deque
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
+from etl_scripts.watermarks import (
+    get_watermark, set_watermark, merge_incremental, load_comment_index, save_comment_index
+)
+from etl_scripts.rate_limiter import TokenBucket
+from etl_scripts.storage import save_parquet
+from etl_scripts.exports import schedule_exports
+from etl_scripts.schema import apply_review_schema
 
 # Load environment variables from .env file
 load_dotenv()
@@ -62,10 +71,47 @@ def load_config():
     except Exception as e:
         raise e
 #############################################
+# RATE LIMITING
+#############################################
+
+# One limiter per process, so every Reddit call in a run (all apps, all
+# collectors, comment expansion) shares the same API budget
+_rate_limiter = None
+
+def get_rate_limiter(requests_per_minute=100):
+    """Return the token bucket shared by every Reddit request in this run"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = TokenBucket(requests_per_minute)
+        logger.info(f"Reddit rate limiter initialized at {requests_per_minute} requests per minute")
+    return _rate_limiter
+
+class RateLimitedRequestor(asyncprawcore.Requestor):
+    """Requestor that waits on the shared token bucket before every HTTP request"""
+
+    def __init__(self, *args, rate_limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter
+
+    async def request(self, *args, **kwargs):
+        await self.rate_limiter.acquire()
+        response = await super().request(*args, **kwargs)
+
+        headers = response.headers
+        if response.status == 429:
+            self.rate_limiter.pause(float(headers.get('x-ratelimit-reset', 60)))
+        elif 'x-ratelimit-remaining' in headers:
+            self.rate_limiter.update_from_headers(
+                headers.get('x-ratelimit-remaining'),
+                headers.get('x-ratelimit-reset')
+            )
+        return response
+
+#############################################
 # EXTRACTION PART
 #############################################
 
-async def main(app_name, subreddit_name, app_path):
+async def main(app_name, subreddit_name, app_path, incremental=True):
     """Main function to orchestrate the asynchronous data collection process"""
     logger.info(f"Starting ETL process for app: {app_name}, subreddit: {subreddit_name}, path: {app_path}")
     
@@ -73,86 +119,144 @@ async def main(app_name, subreddit_name, app_path):
     config = load_config()
     reddit_config = config.get('reddit_api', {})
     
-    # Initialize Reddit API client using asyncpraw with config values
+    # Initialize Reddit API client using asyncpraw with config values; every
+    # request goes through the shared rate limiter
+    rate_limiter = get_rate_limiter(reddit_config.get('requests_per_minute', 100))
     reddit = asyncpraw.Reddit(
         client_id=reddit_config.get('client_id'),
         client_secret=reddit_config.get('client_secret'),
-        user_agent=reddit_config.get('user_agent')
+        user_agent=reddit_config.get('user_agent'),
+        requestor_class=RateLimitedRequestor,
+        requestor_kwargs={'rate_limiter': rate_limiter}
     )
 
-    # Set the subreddit to scrape using subreddit_name
-    subreddit = await reddit.subreddit(subreddit_name)
-
-    # Calculate date 1 year ago from today
-    one_year_ago = int((datetime.now() - timedelta(days=365)).timestamp())
-    start_date = datetime.fromtimestamp(one_year_ago).strftime('%Y-%m-%d')
-    end_date = datetime.now().strftime('%Y-%m-%d')
-    logger.info(f"Collecting posts from {start_date} to {end_date}")
-
-    # Initialize tracking of processed IDs to avoid duplicates
-    processed_ids = set()
-
-    # Run monthly collection for better historical coverage
-    monthly_data = await collect_monthly_paginated(reddit, subreddit, one_year_ago, processed_ids)
-    logger.info(f"Collected {len(monthly_data)} items from monthly pagination")
-    logger.info(f"Posts: {len([x for x in monthly_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in monthly_data if x['type'] == 'comment'])}")
-
-    # Run each collection method separately
-    new_data = await collect_sorting(reddit, subreddit, one_year_ago, processed_ids, 'new')
-    logger.info(f"Collected {len(new_data)} items from 'new' sorting")
-    logger.info(f"Posts: {len([x for x in new_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in new_data if x['type'] == 'comment'])}")
-
-    hot_data = await collect_sorting(reddit, subreddit, one_year_ago, processed_ids, 'hot')
-    logger.info(f"Collected {len(hot_data)} items from 'hot' sorting")
-    logger.info(f"Posts: {len([x for x in hot_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in hot_data if x['type'] == 'comment'])}")
-
-    top_data = await collect_sorting(reddit, subreddit, one_year_ago, processed_ids, 'top')
-    logger.info(f"Collected {len(top_data)} items from 'top' sorting")
-    logger.info(f"Posts: {len([x for x in top_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in top_data if x['type'] == 'comment'])}")
-
-    controversial_data = await collect_sorting(reddit, subreddit, one_year_ago, processed_ids, 'controversial')
-    logger.info(f"Collected {len(controversial_data)} items from 'controversial' sorting")
-    logger.info(f"Posts: {len([x for x in controversial_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in controversial_data if x['type'] == 'comment'])}")
-
-    search_data = await collect_search_posts(reddit, subreddit, one_year_ago, processed_ids)
-    logger.info(f"Collected {len(search_data)} items from keyword searches")
-    logger.info(f"Posts: {len([x for x in search_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in search_data if x['type'] == 'comment'])}")
-
-    flair_data = await collect_flair_posts(reddit, subreddit, one_year_ago, processed_ids)
-    logger.info(f"Collected {len(flair_data)} items from flair searches")
-    logger.info(f"Posts: {len([x for x in flair_data if x['type'] == 'post'])}")
-    logger.info(f"Comments: {len([x for x in flair_data if x['type'] == 'comment'])}")
+    # The client and the comment workers are released even if collection fails
+    comment_pool = None
+    try:
+        # Set the subreddit to scrape using subreddit_name
+        subreddit = await reddit.subreddit(subreddit_name)
+
+        # Calculate date 1 year ago from today
+        one_year_ago = int((datetime.now() - timedelta(days=365)).timestamp())
+
+        # Posts this recent always get their comments refetched, since they are
+        # still collecting new ones
+        hot_cutoff = int((datetime.now() - timedelta(days=reddit_config.get('comment_refresh_days', 7))).timestamp())
+
+        # The chronological listings only walk back to the previous run's watermark
+        # (or the start of the hot window, if that is earlier)
+        since = one_year_ago
+        watermark = get_watermark(app_path, 'reddit') if incremental else None
+        if watermark:
+            since = max(one_year_ago, min(int(watermark['newest_timestamp'].timestamp()), hot_cutoff))
+            logger.info(f"Resuming from watermark {watermark['newest_timestamp']} (last post id: {watermark['last_seen_id']})")
+
+        # Comment counts from earlier runs, so unchanged comment trees are not refetched.
+        # Only usable when merging into the existing data, which keeps those comments.
+        comment_index = load_comment_index(app_path) if incremental else None
+
+        start_date = datetime.fromtimestamp(since).strftime('%Y-%m-%d')
+        end_date = datetime.now().strftime('%Y-%m-%d')
+        logger.info(f"Collecting posts from {start_date} to {end_date}")
+
+        # Initialize tracking of processed IDs to avoid duplicates
+        processed_ids = set()
+
+        # Comment trees are expanded by a bounded pool of workers while the
+        # collectors keep discovering submissions
+        comment_pool = CommentExpansionPool(
+            processed_ids, workers=reddit_config.get('comment_workers', 8),
+            comment_index=comment_index, hot_cutoff=hot_cutoff
+        )
+
+        # Every strategy feeds the same dedup gate, so they can all run at once
+        gate = SubmissionGate(
+            processed_ids, comment_pool,
+            stop_ratio=reddit_config.get('early_stop_seen_ratio'),
+            window=reddit_config.get('early_stop_window', 100)
+        )
+
+        # Keyword and flair searches are packed into OR queries up to these limits
+        search_limits = {
+            'max_query_length': reddit_config.get('search_query_max_length', 512),
+            'max_terms_per_query': reddit_config.get('search_max_terms_per_query')
+        }
+
+        # Run the monthly collection (for historical coverage) and every other
+        # collection method concurrently. The ranked listings and searches return
+        # older posts anyway, so they keep the full year and let the comment index
+        # decide whether those posts need their comments refetched.
+        (monthly_data, new_data, hot_data, top_data, controversial_data,
+         search_data, flair_data) = await asyncio.gather(
+            collect_monthly_paginated(reddit, subreddit, since, gate),
+            collect_sorting(reddit, subreddit, since, gate, 'new'),
+            collect_sorting(reddit, subreddit, one_year_ago, gate, 'hot'),
+            collect_sorting(reddit, subreddit, one_year_ago, gate, 'top'),
+            collect_sorting(reddit, subreddit, one_year_ago, gate, 'controversial'),
+            collect_search_posts(reddit, subreddit, one_year_ago, gate, **search_limits),
+            collect_flair_posts(reddit, subreddit, one_year_ago, gate, **search_limits)
+        )
+
+        # Wait for the remaining comment trees before counting what each method collected
+        await comment_pool.close()
+        logger.info(f"Expanded comments for {comment_pool.submissions_expanded} submissions, "
+                    f"skipped {comment_pool.submissions_skipped} with unchanged comment counts, "
+                    f"{comment_pool.submissions_incomplete} incomplete (retried next run)")
+        logger.info(f"Dedup gate: {gate.offered} submissions offered, {gate.accepted} new, {gate.listings_stopped} listings stopped early")
+    finally:
+        if comment_pool is not None:
+            await comment_pool.stop()
+        await reddit.close()
+
+    for label, items in [("monthly pagination", monthly_data), ("'new' sorting", new_data),
+                         ("'hot' sorting", hot_data), ("'top' sorting", top_data),
+                         ("'controversial' sorting", controversial_data),
+                         ("keyword searches", search_data), ("flair searches", flair_data)]:
+        logger.info(f"Collected {len(items)} items from {label}")
+        logger.info(f"Posts: {len([x for x in items if x['type'] == 'post'])}")
+        logger.info(f"Comments: {len([x for x in items if x['type'] == 'comment'])}")
 
     # Combine all data
     all_data = monthly_data + new_data + hot_data + top_data + controversial_data + search_data + flair_data
 
+    # Merge the new items into the previously extracted raw data
+    df_new = pd.DataFrame(all_data)
+    new_ids = set(df_new['id']) if 'id' in df_new.columns else set()
+    if incremental:
+        existing_path = Path(__file__).parent.parent / 'data' / app_path / 'raw_data' / 'reddit.csv'
+        df_new = merge_incremental(df_new, existing_path, ['id'], 'timestamp_dt')
+
     # Process data
-    df = process_dataframe(all_data)
+    df = process_dataframe(df_new)
     
-    # Save raw data
-    save_raw_data(df, app_path)
+    # Save raw data; on incremental runs only the collected rows need to reach the SQLite export
+    save_raw_data(df, app_path, new_rows=df[df['id'].isin(new_ids)] if incremental else None)
 
     # Apply transformations
     df_transformed = transform_data(df, app_name)
 
     # Load the processed data
-    load_data(df_transformed, app_path)
+    processed_delta = df_transformed[df_transformed['review_id'].isin(new_ids)] if incremental else None
+    load_data(df_transformed, app_path, new_rows=processed_delta)
 
     # Run sanity tests
     run_sanity_tests(df_transformed)
 
-    # Close the Reddit instance
-    await reddit.close()
+    # Record which comment trees were fetched now that the data is saved
+    save_comment_index(app_path, comment_pool.fetched)
+
+    # Advance the watermark to the newest post now that the data is saved
+    posts = df[df['type'] == 'post']
+    if not posts.empty:
+        newest_post = posts.loc[posts['timestamp'].idxmax()]
+        set_watermark(app_path, 'reddit', datetime.fromtimestamp(newest_post['timestamp']), newest_post['id'])
+
+    logger.info(f"Reddit requests so far: {rate_limiter.total_requests}, time spent waiting on rate limit: {rate_limiter.total_wait:.1f}s")
     
     logger.info(f"ETL process completed for {app_name}")
+    return True
 
-async def collect_monthly_paginated(reddit, subreddit, start_timestamp, processed_ids):
+async def collect_monthly_paginated(reddit, subreddit, start_timestamp, gate):
     """Extracts posts using monthly time windows to avoid Reddit API limits."""
     data = []
     end_timestamp = int(datetime.now().timestamp())
@@ -168,35 +272,22 @@ async def collect_monthly_paginated(reddit, subreddit, start_timestamp, processe
 
         try:
             posts_collected = 0
+            overlap = gate.track(f"monthly_{month_start_date}")
             async for submission in subreddit.search(query, sort="new", limit=None):
                 # Verify post is within our time window
                 if submission.created_utc < start_timestamp or submission.created_utc > month_end:
                     continue
 
-                if submission.id in processed_ids:
+                is_new = await gate.offer(submission, f"monthly_{month_start_date}", data)
+                if overlap.record(is_new):
+                    break
+                if not is_new:
                     continue
 
-                # Extract submission data
-                post_data = await extract_submission_data(submission)
-                if post_data:
-                    post_data['source'] = f"monthly_{month_start_date}"
-                    data.append(post_data)
-                    processed_ids.add(submission.id)
-
-                    # Process comments for this submission
-                    comment_data = await process_comments(submission)
-                    for item in comment_data:
-                        if item['id'] not in processed_ids:
-                            data.append(item)
-                            processed_ids.add(item['id'])
-
                 posts_collected += 1
                 if posts_collected % 25 == 0:
                     logger.info(f"Collected {posts_collected} posts from time window {month_start_date}")
 
-                # Small delay to avoid rate limits
-                await asyncio.sleep(0.05)
-
         except Exception as e:
             logger.error(f"Error collecting posts for time window {month_start_date}: {e}")
 
@@ -206,7 +297,7 @@ async def collect_monthly_paginated(reddit, subreddit, start_timestamp, processe
     logger.info(f"Finished monthly pagination collection. Total items: {len(data)}")
     return data
 
-async def collect_sorting(reddit, subreddit, since, processed_ids, method):
+async def collect_sorting(reddit, subreddit, since, gate, method):
     """Extracts posts using a specified subreddit sorting method (new, hot, top, controversial)."""
     data = []
     logger.info(f"Collecting posts from '{method}' sorting...")
@@ -226,6 +317,9 @@ async def collect_sorting(reddit, subreddit, since, processed_ids, method):
             else:
                 sorting_iterator = fetch(limit=None)
 
+            source_name = method if time_filter is None else f"{method}_{time_filter}"
+            overlap = gate.track(source_name)
+
             async for submission in sorting_iterator:
                 # Skip if post is older than cutoff date
                 if submission.created_utc < since:
@@ -235,31 +329,16 @@ async def collect_sorting(reddit, subreddit, since, processed_ids, method):
                         break
                     continue
 
-                if submission.id in processed_ids:
+                is_new = await gate.offer(submission, source_name, data)
+                if overlap.record(is_new):
+                    break
+                if not is_new:
                     continue
 
-                # Extract submission data
-                post_data = await extract_submission_data(submission)
-                if post_data:
-                    source_name = method if time_filter is None else f"{method}_{time_filter}"
-                    post_data['source'] = source_name
-                    data.append(post_data)
-                    processed_ids.add(submission.id)
-
-                    # Process comments for this submission
-                    comment_data = await process_comments(submission)
-                    for item in comment_data:
-                        if item['id'] not in processed_ids:
-                            data.append(item)
-                            processed_ids.add(item['id'])
-
                 posts_collected += 1
                 if posts_collected % 50 == 0:
                     logger.info(f"Collected {posts_collected} posts from '{method}' sorting")
 
-                # Small delay to avoid rate limits
-                await asyncio.sleep(0.05)
-
             if time_filter:
                 logger.info(f"Finished collecting {posts_collected} posts from '{method}' with filter '{time_filter}'")
 
@@ -269,7 +348,58 @@ async def collect_sorting(reddit, subreddit, since, processed_ids, method):
     logger.info(f"Finished collecting from '{method}' sorting. Total items: {len(data)}")
     return data
 
-async def collect_search_posts(reddit, subreddit, since, processed_ids):
+#############################################
+# SEARCH QUERY PLANNING
+#############################################
+
+def format_search_clause(term):
+    """Render one search term as a clause that can be OR-ed with others"""
+    if term.startswith('"') or ' ' not in term:
+        return term
+    # Unquoted multi-word terms mean "all of these words", so group them
+    return f"({term})"
+
+def plan_search_queries(terms, max_query_length=512, max_terms_per_query=None):
+    """
+    Pack search terms into as few OR queries as fit within the API's query length.
+
+    Returns a list of (query, terms) pairs, where terms are the original terms the
+    query covers. max_terms_per_query keeps each query's result set (which the API
+    caps) from being shared by too many terms.
+    """
+    plans = []
+    query, batch = "", []
+    for term in dict.fromkeys(terms):  # drop duplicates, keep order
+        clause = format_search_clause(term)
+        candidate = f"{query} OR {clause}" if query else clause
+        full = bool(max_terms_per_query) and len(batch) >= max_terms_per_query
+        if batch and (len(candidate) > max_query_length or full):
+            plans.append((query, batch))
+            query, batch = clause, [term]
+        else:
+            query, batch = candidate, batch + [term]
+    if batch:
+        plans.append((query, batch))
+    return plans
+
+def _term_pattern(words):
+    # Prefix match on a word boundary, so "deliver" also tags "delivered"; the
+    # words of a phrase must follow each other, with any punctuation in between
+    return re.compile(r'\b' + r'\w*\W+'.join(re.escape(word) for word in words.lower().split()))
+
+def match_search_terms(submission, terms):
+    """Return the terms from a batched query that a submission actually matches"""
+    text = f"{submission.title} {submission.selftext if submission.is_self else ''}".lower()
+    matched = []
+    for term in terms:
+        if term.startswith('"'):
+            if _term_pattern(term.strip('"')).search(text):
+                matched.append(term)
+        elif all(_term_pattern(word).search(text) for word in term.split()):
+            matched.append(term)
+    return matched
+
+async def collect_search_posts(reddit, subreddit, since, gate, max_query_length=512, max_terms_per_query=None):
     """Extracts posts by searching for defined keywords related to user experience."""
     data = []
 
@@ -306,48 +436,42 @@ async def collect_search_posts(reddit, subreddit, since, processed_ids):
     ]
     search_terms.extend(compound_terms)
 
-    for term in search_terms:
-        logger.info(f"Searching for term: '{term}'...")
+    # Search for many terms per request; each hit is tagged with the terms it matched
+    plans = plan_search_queries(search_terms, max_query_length, max_terms_per_query)
+    logger.info(f"Planned {len(plans)} batched searches for {len(search_terms)} terms")
+
+    for batch_number, (query, terms) in enumerate(plans, start=1):
+        label = f"search_batch{batch_number}"
+        logger.info(f"Searching batch {batch_number}/{len(plans)} ({len(terms)} terms)...")
+        posts_collected = 0
         try:
-            posts_collected = 0
-            async for submission in subreddit.search(term, sort="new", time_filter="year", limit=None):
+            overlap = gate.track(label)
+            async for submission in subreddit.search(query, sort="new", time_filter="year", limit=None):
                 # Skip if post is older than cutoff
                 if submission.created_utc < since:
                     continue
 
-                if submission.id in processed_ids:
+                matched = match_search_terms(submission, terms)
+                source = f"search_{'|'.join(matched)}" if matched else label
+                is_new = await gate.offer(submission, source, data)
+                if overlap.record(is_new):
+                    break
+                if not is_new:
                     continue
 
-                # Extract submission data
-                post_data = await extract_submission_data(submission)
-                if post_data:
-                    post_data['source'] = f"search_{term}"
-                    data.append(post_data)
-                    processed_ids.add(submission.id)
-
-                    # Process comments for this submission
-                    comment_data = await process_comments(submission)
-                    for item in comment_data:
-                        if item['id'] not in processed_ids:
-                            data.append(item)
-                            processed_ids.add(item['id'])
-
                 posts_collected += 1
                 if posts_collected % 25 == 0:
-                    logger.info(f"Collected {posts_collected} posts from search for '{term}'")
-
-                # Small delay to avoid hitting rate limits
-                await asyncio.sleep(0.05)
+                    logger.info(f"Collected {posts_collected} posts from search batch {batch_number}")
 
         except Exception as e:
-            logger.error(f"Error searching for term '{term}': {e}")
+            logger.error(f"Error searching batch {batch_number} ({query}): {e}")
 
-        logger.info(f"Collected {posts_collected} posts from search term '{term}'")
+        logger.info(f"Collected {posts_collected} posts from search batch {batch_number}")
 
     logger.info(f"Finished collecting from keyword searches. Total items: {len(data)}")
     return data
 
-async def collect_flair_posts(reddit, subreddit, since, processed_ids):
+async def collect_flair_posts(reddit, subreddit, since, gate, max_query_length=512, max_terms_per_query=None):
     """Extracts posts based on specific post flairs in the subreddit."""
     data = []
 
@@ -355,55 +479,185 @@ async def collect_flair_posts(reddit, subreddit, since, processed_ids):
     flairs = ["Complaint", "Issue", "Question", "Discussion", "Experience",
               "Feedback", "Problem", "Help", "Rant", "PSA", "Warning", "Tip"]
 
-    for flair in flairs:
-        logger.info(f"Searching for posts with flair: '{flair}'...")
-        search_query = f"flair:{flair}"
+    # Search for several flairs per request; each hit is tagged with its own flair
+    flair_clauses = {f"flair:{flair}": flair for flair in flairs}
+    plans = plan_search_queries(list(flair_clauses), max_query_length, max_terms_per_query)
+
+    for batch_number, (search_query, clauses) in enumerate(plans, start=1):
+        batch_flairs = [flair_clauses[clause] for clause in clauses]
+        logger.info(f"Searching for posts with flairs: {batch_flairs}...")
 
         try:
             posts_collected = 0
+            overlap = gate.track(f"flair_batch{batch_number}")
             async for submission in subreddit.search(search_query, sort="new", time_filter="year", limit=None):
                 # Skip if post is older than cutoff
                 if submission.created_utc < since:
                     continue
 
-                if submission.id in processed_ids:
+                flair = next((f for f in batch_flairs if f.lower() == (submission.link_flair_text or '').lower()), None)
+                source = f"flair_{flair}" if flair else f"flair_batch{batch_number}"
+                is_new = await gate.offer(submission, source, data)
+                if overlap.record(is_new):
+                    break
+                if not is_new:
                     continue
 
-                # Extract submission data
-                post_data = await extract_submission_data(submission)
-                if post_data:
-                    post_data['source'] = f"flair_{flair}"
-                    data.append(post_data)
-                    processed_ids.add(submission.id)
-
-                    # Process comments for this submission
-                    comment_data = await process_comments(submission)
-                    for item in comment_data:
-                        if item['id'] not in processed_ids:
-                            data.append(item)
-                            processed_ids.add(item['id'])
-
                 posts_collected += 1
                 if posts_collected % 25 == 0:
-                    logger.info(f"Collected {posts_collected} posts with flair '{flair}'")
-
-                await asyncio.sleep(0.05)
+                    logger.info(f"Collected {posts_collected} posts with flairs {batch_flairs}")
 
         except Exception as e:
-            logger.error(f"Error searching for flair '{flair}': {e}")
+            logger.error(f"Error searching for flairs {batch_flairs}: {e}")
 
     logger.info(f"Finished collecting by flair. Total items: {len(data)}")
     return data
 
+class ListingOverlap:
+    """
+    Tracks how many of a listing's recent submissions were already seen.
+
+    Only used when the gate has a stop_ratio. Stopping depends on what concurrent
+    strategies claimed first, so a stopped listing may leave new submissions uncollected.
+    """
+
+    def __init__(self, gate, label):
+        self.gate = gate
+        self.label = label
+        self.recent = deque(maxlen=gate.window)
+
+    def record(self, is_new):
+        """Record one submission; returns True once the listing is mostly duplicates"""
+        self.recent.append(is_new)
+        if self.gate.stop_ratio is None or len(self.recent) < self.recent.maxlen:
+            return False
+        seen_ratio = 1 - sum(self.recent) / len(self.recent)
+        if seen_ratio >= self.gate.stop_ratio:
+            self.gate.listings_stopped += 1
+            logger.info(f"Stopping '{self.label}' early: {seen_ratio:.0%} of the last {len(self.recent)} submissions were already collected")
+            return True
+        return False
+
+class SubmissionGate:
+    """
+    Single dedup point for the submissions found by every collection strategy.
+
+    Each id is claimed before any await, so strategies running concurrently on the
+    event loop never collect the same submission twice.
+    """
+
+    def __init__(self, processed_ids, comment_pool, stop_ratio=None, window=100):
+        self.processed_ids = processed_ids
+        self.comment_pool = comment_pool
+        self.stop_ratio = stop_ratio
+        self.window = window
+        self.offered = 0
+        self.accepted = 0
+        self.listings_stopped = 0
+
+    def track(self, label):
+        """Start tracking the overlap of one listing with what was already collected"""
+        return ListingOverlap(self, label)
+
+    async def offer(self, submission, source, sink):
+        """Collect a submission into sink unless it was already seen; returns True if new"""
+        self.offered += 1
+        if submission.id in self.processed_ids:
+            return False
+        self.processed_ids.add(submission.id)
+        self.accepted += 1
+
+        # Extract submission data
+        post_data = await extract_submission_data(submission)
+        if post_data:
+            post_data['source'] = source
+            sink.append(post_data)
+
+            # Queue the comment tree for expansion by the worker pool
+            await self.comment_pool.submit(submission, sink)
+        return True
+
+class CommentExpansionPool:
+    """Bounded pool of workers that expand comment trees for queued submissions"""
+
+    def __init__(self, processed_ids, workers=8, comment_index=None, hot_cutoff=None):
+        self.processed_ids = processed_ids
+        self.comment_index = comment_index
+        self.hot_cutoff = hot_cutoff
+        self.fetched = {}
+        self.submissions_skipped = 0
+        # Bounded queue so discovery can't run arbitrarily far ahead of the workers
+        self.queue = asyncio.Queue(maxsize=workers * 4)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(max(1, workers))]
+        self.submissions_expanded = 0
+        self.submissions_incomplete = 0
+
+    def needs_fetch(self, submission):
+        """Whether a submission's comment tree has to be (re)fetched"""
+        if self.comment_index is None:
+            return True
+        entry = self.comment_index.get(submission.id)
+        if entry is None:
+            return True
+        if self.hot_cutoff is not None and submission.created_utc >= self.hot_cutoff:
+            return True
+        return entry['num_comments'] != submission.num_comments
+
+    async def submit(self, submission, sink):
+        """Queue a submission; its new comments are appended to sink once fetched"""
+        await self.queue.put((submission, sink))
+
+    async def _worker(self):
+        while True:
+            submission, sink = await self.queue.get()
+            try:
+                if not self.needs_fetch(submission):
+                    self.submissions_skipped += 1
+                    continue
+
+                num_comments = submission.num_comments
+                comment_data, complete = await process_comments(submission)
+                for item in comment_data:
+                    if item['id'] not in self.processed_ids:
+                        sink.append(item)
+                        self.processed_ids.add(item['id'])
+                if not complete:
+                    # Leave it out of the comment index so the next run fetches the tree again
+                    self.submissions_incomplete += 1
+                    continue
+                self.submissions_expanded += 1
+                self.fetched[submission.id] = {'num_comments': num_comments, 'last_fetched': datetime.now()}
+            except Exception as e:
+                logger.warning(f"Error expanding comments for submission {submission.id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def close(self):
+        """Wait for every queued submission to be expanded, then stop the workers"""
+        await self.queue.join()
+        await self.stop()
+
+    async def stop(self):
+        """Stop the workers without waiting for queued submissions"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
 async def process_comments(submission):
-    """Process all comments for a submission using asyncpraw"""
+    """
+    Process all comments for a submission using asyncpraw.
+
+    Returns (comment data, complete); complete is False when the comment tree could
+    not be fully expanded, in which case comment data holds whatever was loaded.
+    """
     comment_data = []
+    complete = True
 
     try:
         # Fixed: Handle potential None comments before trying to access attributes
         if not hasattr(submission, 'comments') or submission.comments is None:
             logger.warning(f"Submission {submission.id} has no comments attribute or it's None")
-            return comment_data
+            return comment_data, False
 
         # Extend comment limit and get all comments
         try:
@@ -411,11 +665,12 @@ async def process_comments(submission):
             all_comments = await submission.comments.list()
         except Exception as e:
             logger.warning(f"Couldn't fully load comments for submission {submission.id}: {e}")
+            complete = False
             # Try to process any comments that were loaded
             if hasattr(submission, 'comments') and hasattr(submission.comments, '_comments'):
                 all_comments = submission.comments._comments
             else:
-                return comment_data  # Return empty list if no comments available
+                return comment_data, complete  # Return empty list if no comments available
 
         for comment in all_comments:
             extracted_data = await extract_comment_data(comment, submission)
@@ -424,8 +679,9 @@ async def process_comments(submission):
                 comment_data.append(extracted_data)
     except Exception as e:
         logger.warning(f"Error processing comments for submission {submission.id}: {e}")
+        complete = False
 
-    return comment_data
+    return comment_data, complete
 
 async def extract_submission_data(submission):
     """Extract data from a Reddit submission using asyncpraw"""
@@ -543,41 +799,20 @@ def process_dataframe(data):
 
     return df
 
-def save_raw_data(df, app_path):
-    """Save the raw data to the raw data folder in multiple formats (CSV, Excel, SQLite)"""
+def save_raw_data(df, app_path, new_rows=None):
+    """Save the raw data to the raw data folder as Parquet, with CSV, Excel and SQLite exports"""
     # Create directory structure if it doesn't exist using Path
     data_dir = Path(__file__).parent.parent / 'data' / app_path / 'raw_data'
     data_dir.mkdir(parents=True, exist_ok=True)
     
-    # 1. Save to CSV
-    csv_file = data_dir / 'reddit.csv'
-    df.to_csv(csv_file, index=False)
-    logger.info(f"Raw data saved to CSV: {csv_file}")
-    
-    # 2. Save to Excel
-    excel_file = data_dir / 'reddit.xlsx'
-    df.to_excel(excel_file, index=False)
-    logger.info(f"Raw data saved to Excel: {excel_file}")
+    # 1. Save to Parquet (canonical copy read by downstream stages)
+    parquet_file = save_parquet(df, data_dir / 'reddit.parquet')
+    logger.info(f"Raw data saved to Parquet: {parquet_file}")
     
-    # 3. Save to SQLite
-    sqlite_file = data_dir / 'reddit.db'
-    conn = sqlite3.connect(sqlite_file)
+    # 2. CSV, Excel and SQLite copies are written by the export worker
+    schedule_exports(parquet_file, 'raw_data', new_rows=new_rows)
     
-    # Convert timestamp_dt to string to avoid SQLite datetime issues
-    df_sqlite = df.copy()
-    if 'timestamp_dt' in df_sqlite.columns:
-        df_sqlite['timestamp_dt'] = df_sqlite['timestamp_dt'].astype(str)
-    
-    try:
-        # Create a table 'raw_data' and save the dataframe
-        df_sqlite.to_sql('raw_data', conn, if_exists='replace', index=False)
-        logger.info(f"Raw data saved to SQLite database: {sqlite_file}")
-    except Exception as e:
-        logger.error(f"Error saving to SQLite: {e}")
-    finally:
-        conn.close()
-    
-    return str(csv_file)
+    return str(parquet_file)
 
 #############################################
 # TRANSFORMATION PART
@@ -611,7 +846,8 @@ def transform_data(df, app_name):
     df_transformed.rename(columns={
         'complaint': 'review',
         'timestamp_dt': 'review_datetime',
-        'upvotes': 'upvote_count'
+        'upvotes': 'upvote_count',
+        'id': 'review_id'
     }, inplace=True)
 
     # Add new columns
@@ -620,11 +856,12 @@ def transform_data(df, app_name):
 
     # Drop unnecessary columns
     df_transformed.drop(columns=[
-        'id', 'date', 'type', 'time', 'timestamp', 'url',
+        'date', 'type', 'time', 'timestamp', 'url',
         'permalink', 'is_self_post', 'source', 'upvote_ratio',
         'flair', 'username', 'title'
     ], inplace=True)
 
+    df_transformed = apply_review_schema(df_transformed)
     logger.info(f"Data transformation complete. Transformed data shape: {df_transformed.shape}")
 
     return df_transformed
@@ -633,46 +870,25 @@ def transform_data(df, app_name):
 # LOADING PART
 #############################################
 
-def load_data(df, app_path):
-    """Load the transformed data to multiple formats (CSV, Excel, SQLite) in the processed data folder"""
+def load_data(df, app_path, new_rows=None):
+    """Load the transformed data to multiple formats (Parquet, CSV, Excel, SQLite) in the processed data folder"""
     logger.info("Starting data loading...")
 
     # Create directory structure if it doesn't exist using Path
     processed_dir = Path(__file__).parent.parent / 'data' / app_path / 'processed_data'
     processed_dir.mkdir(parents=True, exist_ok=True)
     
-    # 1. Save to CSV
-    csv_file = processed_dir / 'reddit.csv'
-    df.to_csv(csv_file, index=False)
-    logger.info(f"Processed data saved to CSV: {csv_file}")
-    
-    # 2. Save to Excel
-    excel_file = processed_dir / 'reddit.xlsx'
-    df.to_excel(excel_file, index=False)
-    logger.info(f"Processed data saved to Excel: {excel_file}")
+    # 1. Save to Parquet (canonical copy read by downstream stages)
+    parquet_file = save_parquet(df, processed_dir / 'reddit.parquet')
+    logger.info(f"Processed data saved to Parquet: {parquet_file}")
     
-    # 3. Save to SQLite
-    sqlite_file = processed_dir / 'reddit.db'
-    conn = sqlite3.connect(sqlite_file)
+    # 2. CSV, Excel and SQLite copies are written by the export worker
+    schedule_exports(parquet_file, 'processed_data', new_rows=new_rows)
     
-    # Convert datetime to string to avoid SQLite datetime issues
-    df_sqlite = df.copy()
-    if 'review_datetime' in df_sqlite.columns:
-        df_sqlite['review_datetime'] = df_sqlite['review_datetime'].astype(str)
-    
-    try:
-        # Create a table 'processed_data' and save the dataframe
-        df_sqlite.to_sql('processed_data', conn, if_exists='replace', index=False)
-        logger.info(f"Processed data saved to SQLite database: {sqlite_file}")
-    except Exception as e:
-        logger.error(f"Error saving processed data to SQLite: {e}")
-    finally:
-        conn.close()
-
     logger.info("===== DATA LOADING COMPLETE =====")
-    logger.info(f"Saved {len(df)} records in multiple formats")
+    logger.info(f"Saved {len(df)} records to Parquet")
 
-    return str(csv_file)
+    return str(parquet_file)
 
 #############################################
 # SANITY TESTS
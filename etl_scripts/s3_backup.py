@@ -5,14 +5,29 @@ S3 Backup Script - Uploads data from platform folders to Amazon S3
 
 import os
 import sys
+import json
+import shutil
 import boto3
 import yaml
 import logging
 import sqlite3
+import gzip
+import time
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from etl_scripts.storage import fingerprint_file
+
+try:
+    import zstandard
+except ImportError:  # archive mode falls back to gzip
+    zstandard = None
 
 # ───────────────────────────────────────────────────────────── #
 # LOGGING SETUP
@@ -40,6 +55,19 @@ logger = logging.getLogger("s3_backup")
 # LOAD CONFIG (.env and config.yaml)
 # ───────────────────────────────────────────────────────────── #
 
+# Files uploaded at once, multipart part size, and parts in flight per file
+DEFAULT_UPLOAD_WORKERS = 8
+DEFAULT_MULTIPART_CHUNK_SIZE_MB = 16
+DEFAULT_MULTIPART_CONCURRENCY = 4
+
+# What was last uploaded, kept locally and mirrored to the bucket
+MANIFEST_PATH = project_root / "data" / "s3_backup_manifest.json"
+MANIFEST_KEY = "_backup/manifest.json"
+
+# Archive mode: compressed blobs named by content hash, plus one index object per run
+BLOB_PREFIX = "blobs"
+INDEX_PREFIX = "index"
+
 def load_config():
     """Load AWS credentials from .env and values from config.yaml"""
     try:
@@ -69,7 +97,13 @@ def load_config():
             "aws_access_key_id": aws_access_key_id,
             "aws_secret_access_key": aws_secret_access_key,
             "region_name": os.getenv("AWS_REGION", config["aws"]["region_name"]),
-            "bucket_name": os.getenv("AWS_BUCKET_NAME", config["aws"]["bucket_name"])
+            "bucket_name": os.getenv("AWS_BUCKET_NAME", config["aws"]["bucket_name"]),
+            "upload_workers": config["aws"].get("upload_workers", DEFAULT_UPLOAD_WORKERS),
+            "multipart_chunk_size_mb": config["aws"].get("multipart_chunk_size_mb", DEFAULT_MULTIPART_CHUNK_SIZE_MB),
+            "multipart_concurrency": config["aws"].get("multipart_concurrency", DEFAULT_MULTIPART_CONCURRENCY),
+            "delete_orphans": config["aws"].get("delete_orphans", False),
+            "backup_mode": config["aws"].get("backup_mode", "files"),
+            "archive_compression": config["aws"].get("archive_compression", "zstd"),
         }
 
         return aws_config
@@ -84,20 +118,33 @@ def load_config():
 
 def create_s3_client(aws_config):
     try:
+        # Every file worker can have a full set of multipart parts in flight
+        max_connections = aws_config.get('upload_workers', DEFAULT_UPLOAD_WORKERS) * aws_config.get('multipart_concurrency', DEFAULT_MULTIPART_CONCURRENCY)
         return boto3.client(
             's3',
             aws_access_key_id=aws_config['aws_access_key_id'],
             aws_secret_access_key=aws_config['aws_secret_access_key'],
-            region_name=aws_config['region_name']
+            region_name=aws_config['region_name'],
+            config=Config(max_pool_connections=max(10, max_connections))
         )
     except Exception as e:
         logger.error(f"Error creating S3 client: {str(e)}")
         return None
 
-def upload_file_to_s3(s3_client, file_path, bucket_name, s3_key):
+def create_transfer_config(aws_config):
+    """Multipart settings used for every upload; files above one chunk are sent in parallel parts"""
+    chunk_size = int(aws_config.get('multipart_chunk_size_mb', DEFAULT_MULTIPART_CHUNK_SIZE_MB) * 1024 * 1024)
+    return TransferConfig(
+        multipart_threshold=chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=aws_config.get('multipart_concurrency', DEFAULT_MULTIPART_CONCURRENCY),
+        use_threads=True
+    )
+
+def upload_file_to_s3(s3_client, file_path, bucket_name, s3_key, transfer_config=None):
     try:
         logger.info(f"Uploading {file_path} to s3://{bucket_name}/{s3_key}")
-        s3_client.upload_file(file_path, bucket_name, s3_key)
+        s3_client.upload_file(str(file_path), bucket_name, s3_key, Config=transfer_config)
         logger.info(f"Successfully uploaded {file_path} to S3")
         return True
     except ClientError as e:
@@ -108,38 +155,353 @@ def upload_file_to_s3(s3_client, file_path, bucket_name, s3_key):
 # BACKUP LOGIC
 # ───────────────────────────────────────────────────────────── #
 
-def backup_platform_data(s3_client, bucket_name, data_dir, platform_name):
-    logger.info(f"Starting backup for platform: {platform_name}")
+def backup_platform_data(data_dir, platform_name):
+    """List the (local path, S3 key) pairs to back up for one platform folder"""
+    logger.info(f"Collecting files for platform: {platform_name}")
     platform_dir = data_dir / platform_name
     if not platform_dir.exists():
         logger.warning(f"Platform directory {platform_dir} does not exist")
-        return 0
+        return []
 
-    files_processed = 0
+    jobs = []
 
     for data_type in ["raw_data", "processed_data"]:
         sub_dir = platform_dir / data_type
         if sub_dir.exists():
-            files_processed += process_directory(s3_client, bucket_name, sub_dir, platform_name, data_type)
+            jobs.extend(process_directory(sub_dir, platform_name, data_type))
         else:
             logger.warning(f"{data_type} directory {sub_dir} does not exist")
 
-    logger.info(f"Completed backup for platform {platform_name} - {files_processed} files uploaded")
-    return files_processed
+    return jobs
 
-def process_directory(s3_client, bucket_name, directory, platform_name, data_type):
-    files_processed = 0
+def process_directory(directory, platform_name, data_type):
+    jobs = []
 
     for root, _, files in os.walk(directory):
         for file in files:
             file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(file_path, directory)
-            s3_key = f"{platform_name}/{data_type}/{relative_path}"
+            relative_path = Path(os.path.relpath(file_path, directory)).as_posix()
+            jobs.append((file_path, f"{platform_name}/{data_type}/{relative_path}"))
+
+    return jobs
+
+def upload_files(s3_client, bucket_name, jobs, workers=DEFAULT_UPLOAD_WORKERS, transfer_config=None):
+    """
+    Upload (local path, S3 key) pairs with a bounded pool of workers.
+
+    Returns (jobs uploaded successfully, bytes uploaded) and logs the aggregate throughput.
+    """
+    uploaded_jobs = []
+    uploaded_bytes = 0
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    def upload(job):
+        nonlocal uploaded_bytes
+        file_path, s3_key = job
+        size = os.path.getsize(file_path)
+        if upload_file_to_s3(s3_client, file_path, bucket_name, s3_key, transfer_config):
+            with lock:
+                uploaded_jobs.append(job)
+                uploaded_bytes += size
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='s3_upload') as executor:
+        futures = [executor.submit(upload, job) for job in jobs]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Unexpected error during upload: {str(e)}")
+
+    elapsed = time.monotonic() - start
+    throughput = uploaded_bytes / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    logger.info(
+        f"Uploaded {len(uploaded_jobs)}/{len(jobs)} files, {uploaded_bytes / (1024 * 1024):.1f} MB "
+        f"in {elapsed:.1f}s ({throughput:.2f} MB/s) with {workers} workers"
+    )
+    return uploaded_jobs, uploaded_bytes
+
+# ───────────────────────────────────────────────────────────── #
+# DELTA SYNC
+# ───────────────────────────────────────────────────────────── #
+
+class LocalS3Client:
+    """
+    Filesystem stand-in for the boto3 S3 client, covering the calls the backup makes.
+
+    Objects are stored as files under root/<bucket>/<key>; use it to exercise the
+    sync logic without AWS.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def _object_path(self, bucket, key):
+        return self.root / bucket / key
+
+    def upload_file(self, Filename, Bucket, Key, Config=None):
+        path = self._object_path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(Filename, path)
+
+    def put_object(self, Bucket, Key, Body):
+        path = self._object_path(Bucket, Key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(Body if isinstance(Body, bytes) else Body.encode('utf-8'))
+
+    def get_object(self, Bucket, Key):
+        return {'Body': open(self._object_path(Bucket, Key), 'rb')}
+
+    def download_file(self, Bucket, Key, Filename, Config=None):
+        shutil.copyfile(self._object_path(Bucket, Key), Filename)
 
-            if upload_file_to_s3(s3_client, file_path, bucket_name, s3_key):
-                files_processed += 1
+    def delete_object(self, Bucket, Key):
+        self._object_path(Bucket, Key).unlink(missing_ok=True)
 
-    return files_processed
+def load_backup_manifest(s3_client, bucket_name, manifest_path=MANIFEST_PATH):
+    """Return {S3 key: fingerprint} of the last backup, from disk or else the bucket's copy"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('files', {})
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable backup manifest {manifest_path}: {str(e)}")
+
+    try:
+        body = s3_client.get_object(Bucket=bucket_name, Key=MANIFEST_KEY)['Body']
+        try:
+            files = json.loads(body.read()).get('files', {})
+        finally:
+            body.close()
+        logger.info(f"Restored backup manifest from s3://{bucket_name}/{MANIFEST_KEY}")
+        return files
+    except (ClientError, OSError, ValueError):
+        logger.info("No backup manifest found; every file will be uploaded")
+        return {}
+
+def save_backup_manifest(s3_client, bucket_name, files, manifest_path=MANIFEST_PATH):
+    """Write the manifest locally and mirror it to the bucket"""
+    payload = json.dumps({'updated_at': datetime.now().isoformat(), 'files': files}, indent=2, sort_keys=True)
+    manifest_path = Path(manifest_path)
+    tmp_path = manifest_path.with_suffix('.json.tmp')
+    tmp_path.write_text(payload, encoding='utf-8')
+    os.replace(tmp_path, manifest_path)
+    try:
+        s3_client.put_object(Bucket=bucket_name, Key=MANIFEST_KEY, Body=payload.encode('utf-8'))
+    except ClientError as e:
+        logger.error(f"Error mirroring backup manifest to S3: {str(e)}")
+
+# ───────────────────────────────────────────────────────────── #
+# CONTENT-ADDRESSED ARCHIVE
+# ───────────────────────────────────────────────────────────── #
+
+def resolve_compression(compression):
+    """zstd when the zstandard package is installed, gzip otherwise"""
+    if compression == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed, compressing backup blobs with gzip")
+        return "gzip"
+    return compression
+
+def blob_key(sha256, compression):
+    extension = "zst" if compression == "zstd" else "gz"
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256}.{extension}"
+
+def compress_file(source_path, target_path, compression):
+    """Compress a file chunk by chunk, so large files never sit in memory"""
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        if compression == "zstd":
+            zstandard.ZstdCompressor(level=10, threads=-1).copy_stream(source, target)
+        else:
+            with gzip.GzipFile(fileobj=target, mode='wb', compresslevel=6) as compressed:
+                shutil.copyfileobj(source, compressed, 1024 * 1024)
+
+def decompress_file(source_path, target_path, compression):
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        if compression == "zstd":
+            zstandard.ZstdDecompressor().copy_stream(source, target)
+        else:
+            with gzip.GzipFile(fileobj=source, mode='rb') as compressed:
+                shutil.copyfileobj(compressed, target, 1024 * 1024)
+
+def archive_files(s3_client, bucket_name, changed, known_blobs, compression,
+                  workers=DEFAULT_UPLOAD_WORKERS, transfer_config=None):
+    """
+    Upload changed files as compressed blobs keyed by their SHA-256.
+
+    changed holds (local path, S3 key, fingerprint) tuples. Content already stored as
+    a blob (in known_blobs, or earlier in this run) is not uploaded again. Returns
+    {S3 key: {'blob', 'compressed_size'}} for the files now stored in the bucket.
+    """
+    archived = {}
+    lock = threading.Lock()
+    in_flight = {}
+    raw_bytes = 0
+    sent_bytes = 0
+    start = time.monotonic()
+
+    def archive(job):
+        nonlocal raw_bytes, sent_bytes
+        file_path, s3_key, current = job
+        key = blob_key(current['sha256'], compression)
+        with lock:
+            # Identical files (in this run or an earlier one) share one blob
+            if key in known_blobs:
+                archived[s3_key] = {'blob': key, 'compressed_size': known_blobs[key]}
+                return
+            waiter = in_flight.get(key)
+            if waiter is None:
+                in_flight[key] = threading.Event()
+        if waiter is not None:
+            waiter.wait()
+            with lock:
+                if key in known_blobs:
+                    archived[s3_key] = {'blob': key, 'compressed_size': known_blobs[key]}
+            return
+
+        try:
+            with tempfile.TemporaryDirectory(prefix='s3_blob_') as tmp_dir:
+                compressed_path = Path(tmp_dir) / Path(key).name
+                compress_file(file_path, compressed_path, compression)
+                compressed_size = compressed_path.stat().st_size
+                if upload_file_to_s3(s3_client, compressed_path, bucket_name, key, transfer_config):
+                    with lock:
+                        known_blobs[key] = compressed_size
+                        archived[s3_key] = {'blob': key, 'compressed_size': compressed_size}
+                        raw_bytes += current['size']
+                        sent_bytes += compressed_size
+        finally:
+            with lock:
+                in_flight.pop(key).set()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='s3_archive') as executor:
+        futures = [executor.submit(archive, job) for job in changed]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Unexpected error while archiving: {str(e)}")
+
+    elapsed = time.monotonic() - start
+    ratio = sent_bytes / raw_bytes if raw_bytes else 0.0
+    logger.info(
+        f"Archived {len(archived)}/{len(changed)} changed files: {raw_bytes / (1024 * 1024):.1f} MB compressed to "
+        f"{sent_bytes / (1024 * 1024):.1f} MB ({ratio:.0%}) with {compression} in {elapsed:.1f}s"
+    )
+    return archived
+
+def write_backup_index(s3_client, bucket_name, files):
+    """Upload this run's index (logical path -> blob) and point index/latest.json at it"""
+    run_key = f"{INDEX_PREFIX}/{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    index = {
+        'created_at': datetime.now().isoformat(),
+        'files': {
+            s3_key: {'blob': entry['blob'], 'sha256': entry['sha256'], 'size': entry['size']}
+            for s3_key, entry in files.items() if entry.get('blob')
+        },
+    }
+    payload = json.dumps(index, indent=2, sort_keys=True).encode('utf-8')
+    s3_client.put_object(Bucket=bucket_name, Key=run_key, Body=payload)
+    s3_client.put_object(Bucket=bucket_name, Key=f"{INDEX_PREFIX}/latest.json", Body=payload)
+    logger.info(f"Wrote backup index s3://{bucket_name}/{run_key} ({len(index['files'])} files)")
+    return run_key
+
+def restore_backup(s3_client, bucket_name, target_dir, index_key=f"{INDEX_PREFIX}/latest.json"):
+    """Rebuild the backed-up files under target_dir from an archive-mode index"""
+    body = s3_client.get_object(Bucket=bucket_name, Key=index_key)['Body']
+    try:
+        index = json.loads(body.read())
+    finally:
+        body.close()
+
+    target_dir = Path(target_dir)
+    with tempfile.TemporaryDirectory(prefix='s3_restore_') as tmp_dir:
+        for s3_key, entry in index['files'].items():
+            compressed_path = Path(tmp_dir) / Path(entry['blob']).name
+            s3_client.download_file(bucket_name, entry['blob'], str(compressed_path))
+            target_path = target_dir / s3_key
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            decompress_file(compressed_path, target_path, "zstd" if entry['blob'].endswith('.zst') else "gzip")
+            compressed_path.unlink()
+    logger.info(f"Restored {len(index['files'])} files from {index_key} to {target_dir}")
+    return len(index['files'])
+
+def sync_to_s3(s3_client, bucket_name, jobs, manifest_path=MANIFEST_PATH, workers=DEFAULT_UPLOAD_WORKERS,
+               transfer_config=None, delete_orphans=False, mode="files", compression="zstd"):
+    """
+    Upload only the (local path, S3 key) pairs that are new or changed since the last backup.
+
+    Files are compared by size and mtime, and by SHA-256 when those differ, against
+    the manifest. In "files" mode each file is uploaded as is under its key; in
+    "archive" mode it is stored as a compressed content-addressed blob and the run's
+    index maps keys to blobs. Keys in the manifest with no local file any more are
+    removed when delete_orphans is set. Returns the number of files uploaded.
+    """
+    archive = mode == "archive"
+    if archive:
+        compression = resolve_compression(compression)
+    previous = load_backup_manifest(s3_client, bucket_name, manifest_path)
+    files = {}
+    changed = []
+
+    for file_path, s3_key in jobs:
+        try:
+            current = fingerprint_file(file_path, previous.get(s3_key))
+        except FileNotFoundError:
+            continue
+        entry = previous.get(s3_key, {})
+        # A file backed up in the other mode has to be sent again
+        if entry.get('sha256') == current['sha256'] and bool(entry.get('blob')) == archive:
+            files[s3_key] = dict(entry, **current)
+        else:
+            changed.append((file_path, s3_key, current))
+
+    logger.info(f"{len(changed)} new or changed files to upload, {len(files)} unchanged files skipped")
+    uploaded_keys = set()
+    if changed and archive:
+        known_blobs = {entry['blob']: entry.get('compressed_size') for entry in previous.values() if entry.get('blob')}
+        archived = archive_files(s3_client, bucket_name, changed, known_blobs, compression, workers, transfer_config)
+        for _, s3_key, current in changed:
+            if s3_key in archived:
+                files[s3_key] = dict(current, **archived[s3_key])
+        uploaded_keys = set(archived)
+    elif changed:
+        uploaded_jobs, _ = upload_files(
+            s3_client, bucket_name, [(file_path, s3_key) for file_path, s3_key, _ in changed],
+            workers=workers, transfer_config=transfer_config
+        )
+        uploaded_keys = {s3_key for _, s3_key in uploaded_jobs}
+        for _, s3_key, current in changed:
+            if s3_key in uploaded_keys:
+                files[s3_key] = current
+
+    for _, s3_key, _ in changed:
+        if s3_key not in uploaded_keys and s3_key in previous:
+            # Keep the old entry so the file is retried on the next run
+            files[s3_key] = previous[s3_key]
+
+    local_keys = {s3_key for _, s3_key in jobs}
+    orphans = [s3_key for s3_key in previous if s3_key not in local_keys]
+    for s3_key in orphans:
+        if not delete_orphans:
+            files[s3_key] = previous[s3_key]
+            continue
+        if previous[s3_key].get('blob'):
+            # Archived files only disappear from the index; blobs stay for earlier indexes
+            continue
+        try:
+            s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
+            logger.info(f"Deleted orphaned object s3://{bucket_name}/{s3_key}")
+        except ClientError as e:
+            logger.error(f"Error deleting orphaned object {s3_key}: {str(e)}")
+            files[s3_key] = previous[s3_key]
+    if orphans and not delete_orphans:
+        logger.info(f"{len(orphans)} objects no longer exist locally; set aws.delete_orphans to remove them")
+
+    if archive:
+        write_backup_index(s3_client, bucket_name, {key: files[key] for key in files if key in local_keys})
+    save_backup_manifest(s3_client, bucket_name, files, manifest_path)
+    return len(uploaded_keys)
 
 # ───────────────────────────────────────────────────────────── #
 # MAIN
@@ -171,10 +533,25 @@ def main():
         logger.warning("No platform directories found in data directory")
         return 0
 
-    total_files = 0
+    jobs = []
     for platform in platforms:
-        files_processed = backup_platform_data(s3_client, bucket_name, data_dir, platform)
-        total_files += files_processed
+        jobs.extend(backup_platform_data(data_dir, platform))
+
+    # The review warehouse sits next to the platform folders
+    warehouse_db = data_dir / "warehouse.db"
+    if warehouse_db.exists():
+        jobs.append((str(warehouse_db), "warehouse/warehouse.db"))
+
+    # Files from every platform share one pool, so large files don't hold up the rest;
+    # only files that changed since the last backup are sent
+    total_files = sync_to_s3(
+        s3_client, bucket_name, jobs,
+        workers=aws_config.get("upload_workers", DEFAULT_UPLOAD_WORKERS),
+        transfer_config=create_transfer_config(aws_config),
+        delete_orphans=aws_config.get("delete_orphans", False),
+        mode=aws_config.get("backup_mode", "files"),
+        compression=aws_config.get("archive_compression", "zstd")
+    )
 
     logger.info(f"S3 backup process completed. Total files uploaded: {total_files}")
     return 0
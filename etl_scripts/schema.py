@@ -0,0 +1,64 @@
+"""
+Column types of the unified review model.
+
+Every ETL casts its processed output with apply_review_schema, and the combiner and
+aggregation use the same types, so a dataset has identical dtypes whichever stage or
+file format it was read from. Low-cardinality text is categorical and counts use
+nullable integers, so missing values no longer turn columns into object or float64.
+"""
+
+import pandas as pd
+import pyarrow as pa
+
+# Column order of the combined review datasets
+REVIEW_COLUMNS = ['review', 'review_datetime', 'data_source', 'app_name',
+                  'upvote_count', 'total_comments', 'app_rating']
+
+REVIEW_DTYPES = {
+    'review_id': 'string',
+    'review': 'string',
+    'review_datetime': 'datetime64[ns]',
+    'data_source': 'category',
+    'app_name': 'category',
+    'upvote_count': 'Int32',
+    'total_comments': 'Int32',
+    'app_rating': 'Int8',
+    'sentiment': 'category',
+}
+
+def _cast(series, dtype):
+    if dtype == 'datetime64[ns]':
+        values = pd.to_datetime(series, errors='coerce')
+        if values.dt.tz is not None:
+            values = values.dt.tz_convert(None)
+        return values.astype(dtype)
+    if dtype in ('Int32', 'Int8'):
+        return pd.to_numeric(series, errors='coerce').round().astype(dtype)
+    return series.astype(dtype)
+
+def apply_review_schema(df, columns=None):
+    """
+    Cast the review columns of a DataFrame to REVIEW_DTYPES.
+
+    With columns, the result has exactly those columns in that order, missing ones
+    added as nulls; otherwise columns outside the schema are left untouched.
+    """
+    df = df.copy()
+    if columns is not None:
+        for col in columns:
+            if col not in df.columns:
+                df[col] = None
+        df = df[list(columns)]
+    for col, dtype in REVIEW_DTYPES.items():
+        if col in df.columns and df[col].dtype != dtype:
+            df[col] = _cast(df[col], dtype)
+    return df
+
+def review_arrow_schema(columns=REVIEW_COLUMNS):
+    """Arrow schema for writing review datasets chunk by chunk with the model's dtypes"""
+    schema = pa.Schema.from_pandas(apply_review_schema(pd.DataFrame(), columns), preserve_index=False)
+    # Categories are written as dictionaries with int32 indices so any chunk fits
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(i, pa.field(field.name, pa.dictionary(pa.int32(), pa.string())))
+    return schema
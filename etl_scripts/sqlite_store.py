@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import logging
+import pandas as pd
+
+logger = logging.getLogger('sqlite_store')
+
+BATCH_SIZE = 5000
+
+# Processed data from every platform shares the unified review layout
+PROCESSED_SCHEMA = {
+    'key': ['review_id'],
+    'datetime_column': 'review_datetime',
+    'indexes': [['app_name', 'review_datetime'], ['data_source']],
+}
+
+# Declared natural key and indexes per (dataset, stage)
+TABLE_SCHEMAS = {
+    ('google_play', 'raw_data'): {'key': ['reviewId'], 'datetime_column': 'at', 'indexes': [['at']]},
+    ('app_store', 'raw_data'): {'key': ['review_id'], 'datetime_column': 'date', 'indexes': [['date']]},
+    ('reddit', 'raw_data'): {'key': ['id'], 'datetime_column': 'timestamp_dt', 'indexes': [['timestamp_dt'], ['type']]},
+    ('google_play', 'processed_data'): PROCESSED_SCHEMA,
+    ('app_store', 'processed_data'): PROCESSED_SCHEMA,
+    ('reddit', 'processed_data'): PROCESSED_SCHEMA,
+}
+
+def _sql_type(dtype):
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'  # text, and datetimes as ISO-8601 strings (sortable, usable by SQLite date functions)
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+def _to_rows(df):
+    """Convert a DataFrame to tuples of plain Python values SQLite understands"""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+        elif df[col].dtype == object:
+            # Nested values (e.g. App Store developer responses) are stored as JSON text
+            df[col] = df[col].map(lambda value: json.dumps(value, default=str) if isinstance(value, (dict, list)) else value)
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.itertuples(index=False, name=None))
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def ensure_table(conn, table, df, key_columns, indexes=()):
+    """Create the table with its primary key and indexes, adding any new columns"""
+    existing = conn.execute(f"PRAGMA table_info({_quote(table)})").fetchall()
+
+    # Tables written by the old to_sql(if_exists='replace') loaders have no key; rebuild them
+    if existing and not any(column[5] for column in existing):
+        logger.info(f"Rebuilding keyless table {table} with primary key {key_columns}")
+        conn.execute(f"DROP TABLE {_quote(table)}")
+        existing = []
+
+    if not existing:
+        columns = ', '.join(f"{_quote(col)} {_sql_type(df[col].dtype)}" for col in df.columns)
+        primary_key = ', '.join(_quote(col) for col in key_columns)
+        conn.execute(f"CREATE TABLE {_quote(table)} ({columns}, PRIMARY KEY ({primary_key}))")
+    else:
+        known = {column[1] for column in existing}
+        for col in df.columns:
+            if col not in known:
+                conn.execute(f"ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)} {_sql_type(df[col].dtype)}")
+
+    for index_columns in indexes:
+        index_name = f"idx_{table}_{'_'.join(index_columns)}"
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(table)} "
+            f"({', '.join(_quote(col) for col in index_columns)})"
+        )
+
+def upsert_dataframe(db_path, table, df, key_columns, indexes=(), replace=False, prune=None, scope=None):
+    """
+    Insert or update rows by their natural key in a single transaction.
+
+    replace=True clears the table first (a full rebuild that keeps schema and indexes).
+    prune=(column, cutoff) deletes rows older than cutoff, e.g. outside the retention window.
+    scope={column: value} limits replace and prune to one partition of a shared table.
+    """
+    columns = list(df.columns)
+    column_list = ', '.join(_quote(col) for col in columns)
+    placeholders = ', '.join('?' for _ in columns)
+    updates = ', '.join(f"{_quote(col)} = excluded.{_quote(col)}" for col in columns if col not in key_columns)
+    conflict = ', '.join(_quote(col) for col in key_columns)
+    statement = (
+        f"INSERT INTO {_quote(table)} ({column_list}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({conflict}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+    )
+
+    # Rows sharing a key within one batch would conflict with each other; keep the last
+    df = df.drop_duplicates(subset=key_columns, keep='last')
+
+    scope = scope or {}
+    scope_sql = ''.join(f" AND {_quote(col)} = ?" for col in scope)
+    scope_params = tuple(scope.values())
+
+    conn = connect(db_path)
+    try:
+        with conn:
+            ensure_table(conn, table, df, key_columns, indexes)
+            if replace:
+                conn.execute(f"DELETE FROM {_quote(table)} WHERE 1 = 1{scope_sql}", scope_params)
+            rows = _to_rows(df)
+            for start in range(0, len(rows), BATCH_SIZE):
+                conn.executemany(statement, rows[start:start + BATCH_SIZE])
+            if prune is not None:
+                column, cutoff = prune
+                conn.execute(
+                    f"DELETE FROM {_quote(table)} WHERE {_quote(column)} < ?{scope_sql}",
+                    (pd.Timestamp(cutoff).strftime('%Y-%m-%d %H:%M:%S'),) + scope_params
+                )
+    finally:
+        conn.close()
+
+    logger.info(f"Upserted {len(df)} rows into {db_path}:{table}")
@@ -0,0 +1,162 @@
+import os
+import json
+import hashlib
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import datetime
+from pathlib import Path
+
+# Parquet is the canonical copy of every dataset; downstream stages read it
+# first and only fall back to CSV for data written before it existed.
+PARQUET_COMPRESSION = 'zstd'
+
+logger = logging.getLogger('storage')
+
+def parquet_path(path):
+    """Return the Parquet path for a dataset given any of its file paths"""
+    return Path(path).with_suffix('.parquet')
+
+# Datetime columns of the review datasets; read back from CSV they hold strings, which
+# can't share a Parquet column with the scraper's datetime objects after a merge
+DATETIME_COLUMNS = ['review_datetime', 'at', 'repliedAt', 'timestamp_dt']
+
+def _is_datetime(value):
+    return isinstance(value, (datetime, pd.Timestamp))
+
+def _prepare_for_parquet(df):
+    df = df.copy()
+    for col in df.columns:
+        if col in DATETIME_COLUMNS or (df[col].dtype == object and df[col].map(_is_datetime).any()):
+            # e.g. App Store 'date': CSV strings merged with fresh datetimes
+            df[col] = pd.to_datetime(df[col], errors='coerce', format='mixed')
+        elif df[col].dtype == object:
+            # Nested values (e.g. App Store developer responses) are kept as JSON text
+            if df[col].map(lambda value: isinstance(value, (dict, list))).any():
+                df[col] = df[col].map(lambda value: json.dumps(value, default=str) if isinstance(value, (dict, list)) else value)
+    return df
+
+def save_parquet(df, path):
+    """Write a dataset as compressed Parquet, atomically, and return its path"""
+    path = parquet_path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.parquet.tmp')
+
+    _prepare_for_parquet(df).to_parquet(tmp_path, index=False, compression=PARQUET_COMPRESSION)
+    os.replace(tmp_path, path)
+    logger.info(f"Saved {len(df)} rows to Parquet: {path}")
+    return path
+
+def load_dataset(path, columns=None):
+    """
+    Load a dataset given any of its file paths, preferring the Parquet copy.
+
+    Falls back to the CSV copy, and returns an empty DataFrame if neither exists.
+    """
+    path = Path(path)
+    pq_path = parquet_path(path)
+    if pq_path.exists():
+        return pd.read_parquet(pq_path, columns=columns)
+
+    csv_path = path.with_suffix('.csv')
+    if csv_path.exists():
+        try:
+            df = pd.read_csv(csv_path, usecols=columns)
+        except pd.errors.EmptyDataError:
+            return pd.DataFrame(columns=columns)
+        if 'review_datetime' in df.columns:
+            df['review_datetime'] = pd.to_datetime(df['review_datetime'], errors='coerce')
+        return df
+
+    return pd.DataFrame(columns=columns)
+
+def iter_dataset(path, chunk_size, columns=None):
+    """
+    Yield a dataset in DataFrames of at most chunk_size rows, preferring the Parquet copy.
+
+    Only the requested columns that exist in the file are read; yields nothing if
+    neither copy exists.
+    """
+    path = Path(path)
+    pq_path = parquet_path(path)
+    if pq_path.exists():
+        parquet_file = pq.ParquetFile(pq_path)
+        names = parquet_file.schema_arrow.names
+        selected = [col for col in columns if col in names] if columns else None
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=selected):
+            yield batch.to_pandas()
+        return
+
+    csv_path = path.with_suffix('.csv')
+    if csv_path.exists():
+        usecols = (lambda col: col in columns) if columns else None
+        try:
+            for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunk_size):
+                if 'review_datetime' in chunk.columns:
+                    chunk['review_datetime'] = pd.to_datetime(chunk['review_datetime'], errors='coerce')
+                yield chunk
+        except pd.errors.EmptyDataError:
+            return
+
+def write_chunks(chunks, parquet_output, csv_output, schema):
+    """
+    Stream DataFrame chunks into a Parquet file (and optionally a CSV copy) with a fixed schema.
+
+    Both files are written to temporary paths and swapped in once complete, so readers
+    never see a partial file. Returns the number of rows written.
+    """
+    parquet_tmp = Path(str(parquet_output) + '.tmp')
+    csv_tmp = Path(str(csv_output) + '.tmp') if csv_output else None
+    rows = 0
+    writer = pq.ParquetWriter(parquet_tmp, schema, compression=PARQUET_COMPRESSION)
+    csv_file = open(csv_tmp, 'w', encoding='utf-8', newline='') if csv_tmp else None
+    try:
+        if csv_file:
+            csv_file.write(','.join(schema.names) + '\n')
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            if csv_file:
+                chunk.to_csv(csv_file, header=False, index=False, date_format='%Y-%m-%d %H:%M:%S')
+            rows += len(chunk)
+    except Exception:
+        writer.close()
+        if csv_file:
+            csv_file.close()
+        parquet_tmp.unlink(missing_ok=True)
+        if csv_tmp:
+            csv_tmp.unlink(missing_ok=True)
+        raise
+    writer.close()
+    os.replace(parquet_tmp, parquet_output)
+    if csv_file:
+        csv_file.close()
+        os.replace(csv_tmp, csv_output)
+    return rows
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def fingerprint_file(path, previous=None):
+    """
+    Fingerprint a file as {'size', 'mtime_ns', 'sha256'}.
+
+    The hash is only recomputed when size or mtime differ from the previous
+    fingerprint, so an untouched file costs one stat call.
+    """
+    stat = os.stat(path)
+    current = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if previous and previous.get('size') == current['size'] and previous.get('mtime_ns') == current['mtime_ns'] and previous.get('sha256'):
+        current['sha256'] = previous['sha256']
+    else:
+        current['sha256'] = sha256_file(path)
+    return current
+
+def dataset_exists(path):
+    """Whether a Parquet or CSV copy of the dataset exists"""
+    path = Path(path)
+    return parquet_path(path).exists() or path.with_suffix('.csv').exists()
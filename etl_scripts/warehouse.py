@@ -0,0 +1,192 @@
+"""
+Review warehouse: one SQLite database holding every app's data from every platform.
+
+Processed reviews from all apps and sources land in a single `reviews` table keyed by
+(app_path, data_source, review_id); raw data goes to one `raw_<platform>` table per
+platform. The views `combined_reviews` and `combined_review_data` reproduce the per-app
+combined_reviews.csv and aggregate/combined_review_data.csv.
+
+The ETLs fill it through the `warehouse` export format. To load data extracted before
+the warehouse existed, run:
+
+    python -m etl_scripts.warehouse --backfill
+"""
+
+import sys
+import yaml
+import hashlib
+import logging
+import argparse
+import threading
+import pandas as pd
+from pathlib import Path
+from etl_scripts.storage import load_dataset, dataset_exists
+from etl_scripts.sqlite_store import TABLE_SCHEMAS, connect, upsert_dataframe
+from etl_scripts.schema import REVIEW_COLUMNS, apply_review_schema
+
+WAREHOUSE_DB = Path(__file__).parent.parent / 'data' / 'warehouse.db'
+
+logger = logging.getLogger('warehouse')
+
+# data_source value written by each platform's ETL
+SOURCE_NAMES = {
+    'reddit': 'Reddit',
+    'google_play': 'Google Play',
+    'app_store': 'App Store',
+}
+
+REVIEWS_KEY = ['app_path', 'data_source', 'review_id']
+REVIEWS_INDEXES = [['app_name', 'review_datetime'], ['data_source', 'review_datetime']]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS reviews (
+    app_path TEXT NOT NULL,
+    data_source TEXT NOT NULL,
+    review_id TEXT NOT NULL,
+    app_name TEXT,
+    review TEXT,
+    review_datetime TEXT,
+    upvote_count INTEGER,
+    total_comments INTEGER,
+    app_rating INTEGER,
+    PRIMARY KEY (app_path, data_source, review_id)
+);
+CREATE VIEW IF NOT EXISTS combined_reviews AS
+    SELECT app_path, {', '.join(REVIEW_COLUMNS)} FROM reviews;
+CREATE VIEW IF NOT EXISTS combined_review_data AS
+    SELECT {', '.join(REVIEW_COLUMNS)} FROM reviews;
+"""
+
+_initialized = set()
+_init_lock = threading.Lock()
+
+def init_warehouse(db_path=WAREHOUSE_DB):
+    """Create the reviews table and views once per process"""
+    db_path = Path(db_path)
+    with _init_lock:
+        if db_path in _initialized:
+            return
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = connect(db_path)
+        try:
+            with conn:
+                conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        _initialized.add(db_path)
+
+def _has_partition(db_path, table, scope):
+    conn = connect(db_path)
+    try:
+        exists = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+        if not exists:
+            return False
+        where = ' AND '.join(f'"{col}" = ?' for col in scope)
+        return conn.execute(f'SELECT 1 FROM "{table}" WHERE {where} LIMIT 1', tuple(scope.values())).fetchone() is not None
+    finally:
+        conn.close()
+
+def _fill_review_ids(df):
+    """Rows processed before review_id existed get one derived from their text and timestamp"""
+    if 'review_id' not in df.columns:
+        df['review_id'] = None
+    missing = df['review_id'].isna()
+    if missing.any():
+        keys = df.loc[missing, 'review_datetime'].astype(str) + '|' + df.loc[missing, 'review'].astype(str)
+        df.loc[missing, 'review_id'] = keys.map(lambda key: hashlib.sha1(key.encode('utf-8')).hexdigest()[:16])
+    df['review_id'] = df['review_id'].astype(str)
+    return df
+
+def _to_reviews(df, app_path, dataset):
+    df = df.copy()
+    for col in REVIEW_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    df['data_source'] = SOURCE_NAMES.get(dataset, dataset)
+    df['app_path'] = app_path
+    df = _fill_review_ids(df)
+    return df[['app_path', 'review_id'] + REVIEW_COLUMNS]
+
+def load_into_warehouse(df, app_path, dataset, stage, new_rows=None, db_path=WAREHOUSE_DB):
+    """
+    Write one app's dataset (e.g. reddit processed_data) into its warehouse partition.
+
+    With new_rows, only those rows are upserted and rows older than the dataset's
+    window are pruned; otherwise the partition is replaced with df.
+    """
+    init_warehouse(db_path)
+    schema = TABLE_SCHEMAS.get((dataset, stage))
+    if schema is None:
+        logger.warning(f"No warehouse table declared for {dataset} {stage}, skipping")
+        return None
+
+    if stage == 'processed_data':
+        table, key, indexes = 'reviews', REVIEWS_KEY, REVIEWS_INDEXES
+        scope = {'app_path': app_path, 'data_source': SOURCE_NAMES.get(dataset, dataset)}
+        convert = lambda frame: _to_reviews(frame, app_path, dataset)
+    else:
+        table = f"raw_{dataset}"
+        key = ['app_path'] + schema['key']
+        indexes = [['app_path'] + index for index in schema['indexes']]
+        scope = {'app_path': app_path}
+        convert = lambda frame: frame.assign(app_path=app_path)
+
+    datetime_column = schema['datetime_column']
+    if new_rows is not None and _has_partition(db_path, table, scope):
+        prune = (datetime_column, df[datetime_column].min()) if datetime_column in df.columns and not df.empty else None
+        upsert_dataframe(db_path, table, convert(new_rows), key, indexes, prune=prune, scope=scope)
+    else:
+        upsert_dataframe(db_path, table, convert(df), key, indexes, replace=True, scope=scope)
+    return db_path
+
+def read_view(view, app_path=None, db_path=WAREHOUSE_DB):
+    """Read combined_reviews or combined_review_data, optionally for a single app"""
+    init_warehouse(db_path)
+    conn = connect(db_path)
+    try:
+        if app_path is None:
+            df = pd.read_sql_query(f'SELECT * FROM "{view}"', conn)
+        else:
+            df = pd.read_sql_query(f'SELECT * FROM "{view}" WHERE app_path = ?', conn, params=(app_path,))
+    finally:
+        conn.close()
+    return apply_review_schema(df)
+
+# ───────────────────────────────────────────────────────────── #
+# BACKFILL
+# ───────────────────────────────────────────────────────────── #
+
+def backfill(app_paths, data_dir=None, db_path=WAREHOUSE_DB):
+    """Load every existing raw and processed dataset of the given apps into the warehouse"""
+    data_dir = Path(data_dir) if data_dir else WAREHOUSE_DB.parent
+    loaded = 0
+    for app_path in app_paths:
+        for (dataset, stage) in TABLE_SCHEMAS:
+            path = data_dir / app_path / stage / f"{dataset}.parquet"
+            if not dataset_exists(path):
+                continue
+            df = load_dataset(path)
+            load_into_warehouse(df, app_path, dataset, stage, db_path=db_path)
+            logger.info(f"Backfilled {len(df)} rows from {path}")
+            loaded += 1
+    return loaded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the review warehouse")
+    parser.add_argument('--backfill', action='store_true', help="Load existing datasets of every configured app")
+    parser.add_argument('apps', nargs='*', help="App paths to backfill (default: all apps in config.yaml)")
+    args = parser.parse_args(argv)
+
+    init_warehouse()
+    if args.backfill:
+        app_paths = args.apps
+        if not app_paths:
+            with open(Path(__file__).parent.parent / 'config' / 'config.yaml', 'r') as file:
+                app_paths = [app['app_path'] for app in yaml.safe_load(file).get('apps', [])]
+        loaded = backfill(app_paths)
+        logger.info(f"Backfill complete: {loaded} datasets loaded into {WAREHOUSE_DB}")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
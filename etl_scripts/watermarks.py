@@ -0,0 +1,146 @@
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from etl_scripts.storage import load_dataset
+
+# High-water marks for incremental extraction, one row per (app_path, platform).
+# Kept in SQLite so apps running in parallel can update it safely.
+WATERMARK_DB = Path(__file__).parent.parent / 'data' / 'watermarks.db'
+
+logger = logging.getLogger('watermarks')
+_lock = threading.Lock()
+
+def _connect():
+    WATERMARK_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(WATERMARK_DB, timeout=30)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS watermarks (
+            app_path TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            newest_timestamp TEXT,
+            last_seen_id TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (app_path, platform)
+        )
+    """)
+    return conn
+
+def get_watermark(app_path, platform):
+    """Return {'newest_timestamp': datetime, 'last_seen_id': str} or None if never extracted"""
+    with _lock:
+        conn = _connect()
+        try:
+            row = conn.execute(
+                "SELECT newest_timestamp, last_seen_id FROM watermarks WHERE app_path = ? AND platform = ?",
+                (app_path, platform)
+            ).fetchone()
+        finally:
+            conn.close()
+
+    if row is None or row[0] is None:
+        return None
+    return {'newest_timestamp': datetime.fromisoformat(row[0]), 'last_seen_id': row[1]}
+
+def set_watermark(app_path, platform, newest_timestamp, last_seen_id=None):
+    """Persist the newest item seen for a source; call only after the data is saved"""
+    newest_timestamp = pd.Timestamp(newest_timestamp).to_pydatetime()
+    with _lock:
+        conn = _connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO watermarks (app_path, platform, newest_timestamp, last_seen_id, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (app_path, platform) DO UPDATE SET
+                        newest_timestamp = excluded.newest_timestamp,
+                        last_seen_id = excluded.last_seen_id,
+                        updated_at = excluded.updated_at
+                    """,
+                    (app_path, platform, newest_timestamp.isoformat(), last_seen_id, datetime.now().isoformat())
+                )
+        finally:
+            conn.close()
+    logger.info(f"Watermark for {app_path}/{platform} set to {newest_timestamp} (last id: {last_seen_id})")
+
+def merge_incremental(df_new, existing_path, key_columns, datetime_column, retention_days=365, ascending=False):
+    """
+    Merge freshly extracted rows into the existing dataset.
+
+    Rows are matched on key_columns and the newly extracted copy wins. Anything older
+    than retention_days is dropped so the dataset keeps covering the same window as a
+    full extraction would.
+    """
+    df_existing = load_dataset(existing_path)
+    frames = [df for df in (df_existing, df_new) if not df.empty]
+    if not frames:
+        return df_new
+
+    df = pd.concat(frames, ignore_index=True)
+    df[datetime_column] = pd.to_datetime(df[datetime_column], errors='coerce')
+    df = df.drop_duplicates(subset=key_columns, keep='last')
+
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    df = df[df[datetime_column] >= cutoff]
+    df = df.sort_values(by=datetime_column, ascending=ascending).reset_index(drop=True)
+
+    logger.info(f"Merged {len(df_new)} new rows into {len(df_existing)} existing rows from {existing_path}: {len(df)} rows kept")
+    return df
+
+def _connect_comment_index():
+    conn = _connect()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reddit_comment_index (
+            app_path TEXT NOT NULL,
+            submission_id TEXT NOT NULL,
+            num_comments INTEGER,
+            last_fetched TEXT,
+            PRIMARY KEY (app_path, submission_id)
+        )
+    """)
+    return conn
+
+def load_comment_index(app_path):
+    """Return {submission id: {'num_comments': int, 'last_fetched': datetime}} for an app"""
+    with _lock:
+        conn = _connect_comment_index()
+        try:
+            rows = conn.execute(
+                "SELECT submission_id, num_comments, last_fetched FROM reddit_comment_index WHERE app_path = ?",
+                (app_path,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    return {
+        submission_id: {'num_comments': num_comments, 'last_fetched': datetime.fromisoformat(last_fetched)}
+        for submission_id, num_comments, last_fetched in rows
+    }
+
+def save_comment_index(app_path, entries):
+    """Record the comment count seen when each submission's comments were last fetched"""
+    if not entries:
+        return
+    with _lock:
+        conn = _connect_comment_index()
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO reddit_comment_index (app_path, submission_id, num_comments, last_fetched)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (app_path, submission_id) DO UPDATE SET
+                        num_comments = excluded.num_comments,
+                        last_fetched = excluded.last_fetched
+                    """,
+                    [
+                        (app_path, submission_id, entry['num_comments'], entry['last_fetched'].isoformat())
+                        for submission_id, entry in entries.items()
+                    ]
+                )
+        finally:
+            conn.close()
+    logger.info(f"Comment index for {app_path} updated with {len(entries)} submissions")
@@ -0,0 +1,141 @@
+"""
+Incremental aggregation of every app's combined reviews.
+
+Each app's combined_reviews dataset is copied into its own partition under
+aggregate/partitions/, tagged with the configured app name. A manifest records a
+fingerprint (size, mtime and SHA-256) of each input, so a run only rebuilds the
+partitions whose input changed. aggregate/combined_review_data.{parquet,csv} is then
+a streamed concatenation of the partitions, rewritten only when one of them changed.
+"""
+
+import os
+import json
+import logging
+import pyarrow.parquet as pq
+from pathlib import Path
+from etl_scripts.storage import iter_dataset, parquet_path, dataset_exists, fingerprint_file, write_chunks
+from etl_scripts.combine_platform_reviews import FINAL_COLUMNS, FINAL_SCHEMA, CHUNK_SIZE, standardize_chunk
+
+logger = logging.getLogger('aggregate')
+
+MANIFEST_VERSION = 1
+
+def input_file(combined_path):
+    """The file the combined dataset is read from: Parquet, or the CSV for older data"""
+    pq_path = parquet_path(combined_path)
+    return pq_path if pq_path.exists() else Path(combined_path).with_suffix('.csv')
+
+def fingerprint(path, previous=None):
+    """Fingerprint an input file; a different path (e.g. CSV replaced by Parquet) always rehashes"""
+    if previous and previous.get('path') != str(path):
+        previous = None
+    return dict(fingerprint_file(path, previous), path=str(path))
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable aggregate manifest {manifest_path}: {e}")
+    return {'version': MANIFEST_VERSION, 'partitions': {}, 'order': []}
+
+def save_manifest(manifest, manifest_path):
+    tmp_path = Path(str(manifest_path) + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def build_partition(combined_path, app_name, partition_path, chunk_size=CHUNK_SIZE):
+    """Copy one app's combined reviews into its partition, tagged with the app name"""
+    def batches():
+        for chunk in iter_dataset(combined_path, chunk_size, columns=FINAL_COLUMNS):
+            chunk['app_name'] = app_name
+            yield standardize_chunk(chunk)
+
+    partition_path.parent.mkdir(parents=True, exist_ok=True)
+    return write_chunks(batches(), partition_path, None, FINAL_SCHEMA)
+
+def write_combined_view(partition_paths, parquet_output, csv_output, chunk_size=CHUNK_SIZE):
+    """Concatenate partitions into the combined dataset without loading them whole"""
+    def batches():
+        for partition_path in partition_paths:
+            for batch in pq.ParquetFile(partition_path).iter_batches(batch_size=chunk_size):
+                yield batch.to_pandas()
+
+    return write_chunks(batches(), parquet_output, csv_output, FINAL_SCHEMA)
+
+def aggregate_incremental(app_configs, data_dir, aggregate_dir, chunk_size=CHUNK_SIZE):
+    """
+    Bring aggregate/combined_review_data up to date, rebuilding only changed partitions.
+
+    Returns (total rows, rows per app name) or None when no app has combined data.
+    """
+    aggregate_dir.mkdir(parents=True, exist_ok=True)
+    partitions_dir = aggregate_dir / 'partitions'
+    manifest_path = aggregate_dir / 'manifest.json'
+    parquet_output = aggregate_dir / 'combined_review_data.parquet'
+    csv_output = aggregate_dir / 'combined_review_data.csv'
+
+    manifest = load_manifest(manifest_path)
+    previous = manifest['partitions']
+    partitions = {}
+    rebuilt = []
+
+    for app_config in app_configs:
+        app_path = app_config['app_path']
+        app_name = app_config['app_name']
+        combined_path = data_dir / app_path / 'processed_data' / 'combined_reviews.csv'
+        if not dataset_exists(combined_path):
+            logger.warning(f"No combined reviews file found for {app_name} at {combined_path}")
+            continue
+
+        entry = previous.get(app_path, {})
+        source = fingerprint(input_file(combined_path), entry.get('input'))
+        partition_path = partitions_dir / f"{app_path}.parquet"
+
+        unchanged = (
+            entry.get('input', {}).get('sha256') == source['sha256']
+            and entry.get('app_name') == app_name
+            and partition_path.exists()
+        )
+        if unchanged:
+            logger.info(f"{app_name}: input unchanged, reusing partition ({entry['rows']} reviews)")
+            partitions[app_path] = dict(entry, input=source)
+            continue
+
+        rows = build_partition(combined_path, app_name, partition_path, chunk_size)
+        logger.info(f"{app_name}: rebuilt partition from {source['path']} ({rows} reviews)")
+        partitions[app_path] = {'app_name': app_name, 'input': source, 'partition': partition_path.name, 'rows': rows}
+        rebuilt.append(app_path)
+
+    # Only the apps with combined data this run make up the combined view
+    order = list(partitions)
+
+    # Drop partitions of apps that are no longer configured; a configured app whose
+    # combined data is missing this run keeps its partition for when the data returns
+    configured = {app_config['app_path'] for app_config in app_configs}
+    for app_path in set(previous) - set(partitions):
+        if app_path in configured:
+            partitions[app_path] = previous[app_path]
+            continue
+        (partitions_dir / previous[app_path]['partition']).unlink(missing_ok=True)
+        logger.info(f"Removed aggregate partition for {app_path}")
+
+    if not order:
+        return None
+
+    if rebuilt or order != manifest.get('order') or not parquet_output.exists() or not csv_output.exists():
+        write_combined_view([partitions_dir / partitions[app_path]['partition'] for app_path in order],
+                            parquet_output, csv_output, chunk_size)
+        logger.info(f"Rewrote combined view from {len(order)} partitions ({len(rebuilt)} rebuilt)")
+    else:
+        logger.info("No partitions changed; combined view is up to date")
+
+    save_manifest({'version': MANIFEST_VERSION, 'partitions': partitions, 'order': order}, manifest_path)
+
+    counts = {partitions[app_path]['app_name']: partitions[app_path]['rows'] for app_path in order}
+    return sum(counts.values()), counts
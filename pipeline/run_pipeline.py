@@ -2,14 +2,18 @@ import yaml
 import time
 import asyncio
 import logging
-import pandas as pd
 import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from etl_scripts.app_store_etl import main as app_store_main
 from etl_scripts.google_play_etl import main as play_store_main
 from etl_scripts.reddit_etl import main as reddit_main
-from etl_scripts.combine_platform_reviews import main as combine_main
+from etl_scripts.combine_platform_reviews import main as combine_main, CHUNK_SIZE as COMBINE_CHUNK_SIZE
 from etl_scripts.s3_backup import main as s3_backup_main
+from etl_scripts.exports import wait_for_exports
+from pipeline.stage_graph import Stage, run_stage_graph
+from pipeline.aggregate import aggregate_incremental
+from scoring.sentiment import run_sentiment_stage
 
 # Setup paths
 project_root = Path(__file__).parent.parent
@@ -44,52 +48,104 @@ def load_config():
         logger.error(f"Error loading config file: {e}")
         return None
 
-async def process_app(app_config):
-    """Process a single app across all platforms"""
+def build_app_stages(app_config, pipeline_config=None):
+    """Build the extract and combine stages for a single app"""
     app_name = app_config['app_name']
     app_path = app_config['app_path']
+    combine_chunk_size = (pipeline_config or {}).get('combine_chunk_size', COMBINE_CHUNK_SIZE)
     
-    try:
-        logger.info(f"Starting ETL process for {app_name}...")
-        
-        # Run App Store ETL
-        logger.info(f"Running App Store ETL for {app_name}...")
-        app_store_main(
+    # The App Store and Play Store scrapers are blocking, so they run in the
+    # worker pool off the event loop. Each ETL returns whether it succeeded (or
+    # raises), so a failed extract marks its stage FAILED.
+    async def run_app_store():
+        return await asyncio.to_thread(
+            app_store_main,
             app_name=app_name,
             app_path=app_path,
             app_id=app_config['app_store_id'],
             country="us",
             review_count=20000
         )
-        
-        # Run Play Store ETL
-        logger.info(f"Running Play Store ETL for {app_name}...")
-        play_store_main(
+    
+    async def run_play_store():
+        return await asyncio.to_thread(
+            play_store_main,
             app_config['play_store_id'],
             app_path,
             app_name
         )
-        
-        # Run Reddit ETL
-        logger.info(f"Running Reddit ETL for {app_name}...")
-        await reddit_main(app_name, app_config['subreddit_name'], app_path)
-        
-        # Run Combine Platform Reviews
-        logger.info(f"Combining platform reviews for {app_name}...")
-        combine_success = combine_main(app_path)
-        
+    
+    async def run_reddit():
+        return await reddit_main(app_name, app_config['subreddit_name'], app_path)
+    
+    async def run_combine():
+        combine_success = await asyncio.to_thread(combine_main, app_path, combine_chunk_size)
         if combine_success:
             logger.info(f"Successfully combined reviews for {app_name}")
         else:
             logger.error(f"Failed to combine reviews for {app_name}")
-            
-        logger.info(f"Completed ETL process for {app_name}")
+        return combine_success
+    
+    platforms = {'app_store': run_app_store, 'google_play': run_play_store, 'reddit': run_reddit}
+    stages = [
+        Stage(f"{platform}/{app_path}", func, outputs=(f"{platform}/{app_path}",), group=app_name)
+        for platform, func in platforms.items()
+    ]
+    stages.append(Stage(
+        f"combine/{app_path}", run_combine,
+        inputs=tuple(f"{platform}/{app_path}" for platform in platforms),
+        outputs=(f"combine/{app_path}",),
+        group=app_name
+    ))
+    return stages
+
+def build_pipeline_stages(apps, pipeline_config=None, sentiment_config=None):
+    """Build the full stage graph: per-app ETL, then backup and aggregation side by side, then scoring"""
+    stages = []
+    for app_config in apps:
+        stages.extend(build_app_stages(app_config, pipeline_config))
+    combine_chunk_size = (pipeline_config or {}).get('combine_chunk_size', COMBINE_CHUNK_SIZE)
+    
+    combined_outputs = tuple(f"combine/{app_config['app_path']}" for app_config in apps)
+    
+    # Backup and aggregation only read the combined data, so they run concurrently.
+    # Both run even if some apps failed, using whatever data is on disk.
+    async def run_backup():
+        return await asyncio.to_thread(run_s3_backup)
+    
+    async def run_aggregate():
+        return await asyncio.to_thread(aggregate_review_data, apps, combine_chunk_size)
+    
+    # CSV/Excel/SQLite exports are written in the background; the backup waits
+    # for them so it uploads complete files, aggregation does not
+    async def run_exports():
+        await asyncio.to_thread(wait_for_exports)
         return True
+    
+    stages.append(Stage("exports", run_exports, inputs=combined_outputs, outputs=("exports",), always_run=True))
+    stages.append(Stage("s3_backup", run_backup, inputs=combined_outputs + ("exports",), outputs=("s3_backup",), always_run=True))
+    stages.append(Stage("aggregate", run_aggregate, inputs=combined_outputs, outputs=("aggregate",), always_run=True))
+    
+    # Sentiment scoring reads the aggregate, so it only runs once that succeeded
+    if (sentiment_config or {}).get('enabled', True):
+        async def run_sentiment():
+            return await asyncio.to_thread(run_sentiment_stage, sentiment_config)
         
-    except Exception as e:
-        logger.error(f"Error processing {app_name}: {e}")
-        logger.exception("Detailed traceback:")
-        return False
+        stages.append(Stage("sentiment", run_sentiment, inputs=("aggregate",), outputs=("sentiment",)))
+    return stages
+
+def summarize_apps(apps, results):
+    """Return (app name, success, elapsed seconds) for each app from its stage results"""
+    summary = []
+    for app_config in apps:
+        app_path = app_config['app_path']
+        app_results = [result for name, result in results.items() if name.endswith(f"/{app_path}")]
+        success = all(result.status == "SUCCESS" for result in app_results)
+        starts = [result.start for result in app_results if result.start is not None]
+        ends = [result.end for result in app_results if result.end is not None]
+        elapsed = max(ends) - min(starts) if starts and ends else 0.0
+        summary.append((app_config['app_name'], success, elapsed))
+    return summary
 
 def run_s3_backup():
     """Run the S3 backup process"""
@@ -108,61 +164,34 @@ def run_s3_backup():
         logger.exception("Detailed traceback:")
         return False
 
-def aggregate_review_data(app_configs):
-    """Aggregate all combined review files into a single CSV file"""
-    
+def aggregate_review_data(app_configs, chunk_size=COMBINE_CHUNK_SIZE):
+    """
+    Aggregate all combined review files into a single CSV file.
+
+    Only apps whose combined reviews changed since the last run are reprocessed;
+    see pipeline/aggregate.py.
+    """
     aggregate_dir = project_root / 'aggregate'
-    aggregate_dir.mkdir(parents=True, exist_ok=True)  # Create aggregate directory if it doesn't exist
-    
-    output_path = aggregate_dir / 'combined_review_data.csv'
     
     logger.info("Aggregating combined review data from all apps...")
     
-    all_reviews_dataframes = []
+    try:
+        result = aggregate_incremental(app_configs, project_root / 'data', aggregate_dir, chunk_size)
+    except Exception as e:
+        logger.error(f"Error aggregating review data: {e}")
+        logger.exception("Detailed traceback:")
+        return False
     
-    for app_config in app_configs:
-        app_path = app_config['app_path']
-        processed_dir = project_root / 'data' / app_path / 'processed_data'
-        combined_reviews_path = processed_dir / 'combined_reviews.csv'
-        
-        if combined_reviews_path.exists():
-            try:
-                logger.info(f"Reading data from {combined_reviews_path}")
-                df = pd.read_csv(combined_reviews_path)
-                
-                # Add app name as an additional column for identification
-                df['app_name'] = app_config['app_name']
-                
-                all_reviews_dataframes.append(df)
-                logger.info(f"Successfully loaded {len(df)} reviews for {app_config['app_name']}")
-            except Exception as e:
-                logger.error(f"Error reading combined reviews for {app_config['app_name']}: {e}")
-        else:
-            logger.warning(f"No combined reviews file found for {app_config['app_name']} at {combined_reviews_path}")
-    
-    if all_reviews_dataframes:
-        try:
-            # Concatenate all dataframes
-            combined_df = pd.concat(all_reviews_dataframes, ignore_index=True)
-            
-            # Save to CSV
-            combined_df.to_csv(output_path, index=False)
-            logger.info(f"Successfully aggregated all review data to {output_path}")
-            logger.info(f"Total number of reviews: {len(combined_df)}")
-            
-            # Optional: Print stats about how many reviews from each app
-            app_counts = combined_df['app_name'].value_counts()
-            for app_name, count in app_counts.items():
-                logger.info(f"{app_name}: {count} reviews")
-                
-            return True
-        except Exception as e:
-            logger.error(f"Error aggregating review data: {e}")
-            logger.exception("Detailed traceback:")
-            return False
-    else:
+    if result is None:
         logger.error("No review data found to aggregate")
         return False
+    
+    total, app_counts = result
+    logger.info(f"Successfully aggregated all review data to {aggregate_dir / 'combined_review_data.csv'}")
+    logger.info(f"Total number of reviews: {total}")
+    for app_name, count in app_counts.items():
+        logger.info(f"{app_name}: {count} reviews")
+    return True
 
 async def main():
     """Main ETL controller function that processes all apps"""
@@ -176,32 +205,40 @@ async def main():
         logger.error("No apps found in configuration. Exiting.")
         return
     
+    pipeline_config = config.get('pipeline') or {}
+    max_parallel_apps = pipeline_config.get('max_parallel_apps', len(apps))
+    
+    # Worker pool used for the blocking scrapers (two per app running at once)
+    extract_workers = pipeline_config.get('extract_workers', 2 * max_parallel_apps)
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max(1, extract_workers), thread_name_prefix='etl_extract')
+    )
+    
     start_time = time.time()
     
-    # Process each app in the configuration
-    results = []
-    for app_config in apps:
-        result = await process_app(app_config)
-        results.append((app_config['app_name'], result))
+    # Run every stage as soon as its inputs are ready
+    logger.info(f"Processing {len(apps)} apps with up to {max_parallel_apps} running in parallel")
+    results, _ = await run_stage_graph(build_pipeline_stages(apps, pipeline_config, config.get('sentiment')), max_parallel_groups=max(1, max_parallel_apps))
     
     # Log summary of results
-    for app_name, success in results:
+    for app_name, success, elapsed in summarize_apps(apps, results):
         status = "SUCCESS" if success else "FAILED"
-        logger.info(f"{app_name}: {status}")
-    
-    # Run S3 Backup before aggregation
-    logger.info("Starting S3 backup before aggregation...")
-    backup_success = run_s3_backup()
-    if not backup_success:
-        logger.warning("S3 backup failed, but continuing with aggregation...")
-    
-    # Aggregate all review data after processing all apps
-    logger.info("Starting aggregation of all review data...")
-    aggregate_success = aggregate_review_data(apps)
-    if aggregate_success:
+        logger.info(f"{app_name}: {status} ({elapsed:.2f} seconds)")
+    
+    if results["s3_backup"].status != "SUCCESS":
+        logger.warning("S3 backup failed")
+    if results["aggregate"].status == "SUCCESS":
         logger.info("Successfully aggregated all review data")
     else:
         logger.error("Failed to aggregate review data")
+    if "sentiment" in results:
+        if results["sentiment"].status == "SUCCESS":
+            logger.info("Successfully scored review sentiment")
+        else:
+            logger.error(f"Sentiment scoring {results['sentiment'].status.lower()}")
+    
+    # Make sure no background export is still being written
+    wait_for_exports()
     
     end_time = time.time()
     execution_time = end_time - start_time
@@ -0,0 +1,153 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+
+logger = logging.getLogger('stage_graph')
+
+@dataclass
+class Stage:
+    """A unit of pipeline work that reads some named artifacts and produces others"""
+    name: str
+    func: callable  # async callable returning a truthy value on success
+    inputs: tuple = ()
+    outputs: tuple = ()
+    group: str = None  # e.g. the app a stage belongs to, used for admission control
+    always_run: bool = False  # run once inputs are finished even if some of them failed
+
+@dataclass
+class StageResult:
+    status: str = "PENDING"  # SUCCESS, FAILED or SKIPPED
+    start: float = None
+    end: float = None
+    upstream: list = field(default_factory=list)
+
+    @property
+    def elapsed(self):
+        if self.start is None or self.end is None:
+            return 0.0
+        return self.end - self.start
+
+def resolve_dependencies(stages):
+    """Map each stage name to the names of the stages producing its inputs"""
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"Artifact '{output}' is produced by both '{producers[output]}' and '{stage.name}'")
+            producers[output] = stage.name
+
+    dependencies = {}
+    for stage in stages:
+        missing = [artifact for artifact in stage.inputs if artifact not in producers]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' needs artifacts nobody produces: {missing}")
+        dependencies[stage.name] = sorted({producers[artifact] for artifact in stage.inputs})
+
+    # Reject cycles up front instead of deadlocking at run time
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Dependency cycle detected at stage '{name}'")
+        visiting.add(name)
+        for dependency in dependencies[name]:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+
+    for stage in stages:
+        visit(stage.name)
+
+    return dependencies
+
+def critical_path(results, dependencies):
+    """Return (stage names, seconds) of the longest chain of dependent stages"""
+    longest = {}
+
+    def chain(name):
+        if name not in longest:
+            best = ([], 0.0)
+            for dependency in dependencies[name]:
+                candidate = chain(dependency)
+                if candidate[1] > best[1]:
+                    best = candidate
+            longest[name] = (best[0] + [name], best[1] + results[name].elapsed)
+        return longest[name]
+
+    return max((chain(name) for name in dependencies), key=lambda item: item[1], default=([], 0.0))
+
+async def run_stage_graph(stages, max_parallel_groups=None):
+    """
+    Run stages as soon as the stages producing their inputs have finished.
+
+    Independent stages run concurrently. When max_parallel_groups is set, at most
+    that many groups have stages in flight at once; a group holds its slot from its
+    first stage starting until its last stage finishes, so groups should not
+    depend on each other.
+
+    Returns:
+        tuple: (dict of stage name -> StageResult, (critical path names, seconds))
+    """
+    dependencies = resolve_dependencies(stages)
+    results = {stage.name: StageResult(upstream=dependencies[stage.name]) for stage in stages}
+    finished = {stage.name: asyncio.Event() for stage in stages}
+
+    group_slots = asyncio.Semaphore(max_parallel_groups) if max_parallel_groups else None
+    group_locks = {}
+    group_admitted = set()
+    group_remaining = {}
+    for stage in stages:
+        if stage.group is not None:
+            group_remaining[stage.group] = group_remaining.get(stage.group, 0) + 1
+            group_locks.setdefault(stage.group, asyncio.Lock())
+
+    async def admit(group):
+        async with group_locks[group]:
+            if group not in group_admitted:
+                await group_slots.acquire()
+                group_admitted.add(group)
+
+    def release(group):
+        group_remaining[group] -= 1
+        if group_remaining[group] == 0 and group in group_admitted:
+            group_slots.release()
+
+    async def run(stage):
+        result = results[stage.name]
+        try:
+            for dependency in dependencies[stage.name]:
+                await finished[dependency].wait()
+
+            failed = [name for name in dependencies[stage.name] if results[name].status != "SUCCESS"]
+            if failed and not stage.always_run:
+                result.status = "SKIPPED"
+                logger.warning(f"Skipping stage '{stage.name}' because upstream stages did not succeed: {failed}")
+                return
+
+            if group_slots is not None and stage.group is not None:
+                await admit(stage.group)
+
+            logger.info(f"Starting stage '{stage.name}'")
+            result.start = time.time()
+            try:
+                success = await stage.func()
+            except Exception as e:
+                logger.error(f"Stage '{stage.name}' raised an error: {e}")
+                logger.exception("Detailed traceback:")
+                success = False
+            result.end = time.time()
+            result.status = "SUCCESS" if success else "FAILED"
+            logger.info(f"Stage '{stage.name}' {result.status} in {result.elapsed:.2f} seconds")
+        finally:
+            if group_slots is not None and stage.group is not None:
+                release(stage.group)
+            finished[stage.name].set()
+
+    await asyncio.gather(*(run(stage) for stage in stages))
+
+    path = critical_path(results, dependencies)
+    logger.info(f"Critical path ({path[1]:.2f} seconds): {' -> '.join(path[0])}")
+    return results, path
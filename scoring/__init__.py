@@ -0,0 +1 @@
+# This file marks the directory as a Python package, allowing for module imports.
@@ -0,0 +1,98 @@
+"""
+Persistent cache of model outputs, so unchanged reviews are never scored twice.
+
+Entries are keyed by (model id, label set, hash of the normalized review text) and hold
+the model's float32 score vector. The label set is part of the key because zero-shot
+scores depend on the candidate labels, and a fine-tuned model's on its label order.
+"""
+
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+import numpy as np
+from datetime import datetime
+from pathlib import Path
+
+CACHE_DB = Path(__file__).parent.parent / 'data' / 'inference_cache.db'
+
+# Hashes looked up per query, below SQLite's bound-parameter limit
+LOOKUP_BATCH = 500
+
+logger = logging.getLogger('inference_cache')
+
+def label_set_key(labels):
+    """Short stable key for an ordered list of labels (plus anything else scores depend on)"""
+    return hashlib.sha256(json.dumps(list(labels), ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+class InferenceCache:
+    def __init__(self, db_path=CACHE_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS inference_cache (
+                        model_id TEXT NOT NULL,
+                        label_set TEXT NOT NULL,
+                        text_hash TEXT NOT NULL,
+                        scores BLOB NOT NULL,
+                        created_at TEXT,
+                        PRIMARY KEY (model_id, label_set, text_hash)
+                    ) WITHOUT ROWID
+                """)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get_many(self, model_id, label_set, text_hashes):
+        """Return {text hash: float32 scores} for the hashes that are cached"""
+        unique = list(dict.fromkeys(text_hashes))
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            try:
+                for start in range(0, len(unique), LOOKUP_BATCH):
+                    batch = unique[start:start + LOOKUP_BATCH]
+                    rows = conn.execute(
+                        f"SELECT text_hash, scores FROM inference_cache WHERE model_id = ? AND label_set = ? "
+                        f"AND text_hash IN ({', '.join('?' for _ in batch)})",
+                        (model_id, label_set, *batch)
+                    ).fetchall()
+                    found.update((text_hash, np.frombuffer(scores, dtype=np.float32)) for text_hash, scores in rows)
+            finally:
+                conn.close()
+        self.hits += len(found)
+        self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, model_id, label_set, scores_by_hash):
+        """Store {text hash: scores} in one transaction"""
+        if not scores_by_hash:
+            return
+        created_at = datetime.now().isoformat()
+        rows = [
+            (model_id, label_set, text_hash, np.asarray(scores, dtype=np.float32).tobytes(), created_at)
+            for text_hash, scores in scores_by_hash.items()
+        ]
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO inference_cache (model_id, label_set, text_hash, scores, created_at) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        rows
+                    )
+            finally:
+                conn.close()
@@ -0,0 +1,144 @@
+"""
+Emotion scoring: a score per target emotion, the dominant emotion and threshold flags.
+
+Replaces the per-cell score filling and the iterrows loop in
+notebooks/Emotion_Analysis.ipynb. Scores are kept as a dense float32 matrix
+(review x emotion), so the dominant emotion is an argmax and the flags a comparison,
+and each chunk's columns are added in one concat. Run on the aggregate with:
+
+    python -m scoring.emotion
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+from etl_scripts.storage import iter_dataset, dataset_exists, write_chunks
+from etl_scripts.schema import REVIEW_COLUMNS, apply_review_schema, review_arrow_schema
+from scoring.engine import TextClassifier, score_texts, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from scoring.cache import InferenceCache
+
+logger = logging.getLogger('emotion')
+
+MODEL_ID = "joeddav/distilbert-base-uncased-go-emotions-student"
+
+# Target emotions we want to analyze; ones the model has no label for score 0
+TARGET_EMOTIONS = [
+    'fear', 'optimism', 'anxiety', 'nervousness', 'disappointment',
+    'sadness', 'excitement', 'joy', 'relief', 'hope', 'worry', 'dread', 'confidence'
+]
+
+FLAG_COLUMNS = [f"{emotion}_flag" for emotion in TARGET_EMOTIONS]
+OUTPUT_COLUMNS = REVIEW_COLUMNS + TARGET_EMOTIONS + ['dominant_emotion'] + FLAG_COLUMNS
+
+DEFAULT_EMOTION_CONFIG = {
+    'batch_size': DEFAULT_BATCH_SIZE,
+    'max_length': DEFAULT_MAX_LENGTH,
+    'num_threads': None,   # torch default (all cores)
+    'chunk_size': 5000,    # rows scored and written at a time
+    'use_cache': True,     # reuse scores of reviews seen in earlier runs
+    'threshold': 0.3,      # score at which an emotion's flag is set
+}
+
+aggregate_dir = Path(__file__).parent.parent / 'aggregate'
+INPUT_PATH = aggregate_dir / 'combined_review_data.parquet'
+OUTPUT_PATH = aggregate_dir / 'combined_review_data_with_emotions.parquet'
+
+def target_columns(labels, emotions=TARGET_EMOTIONS):
+    """Column of each target emotion in the model's output, or -1 when the model lacks it"""
+    index = {label.replace('emotion_', ''): i for i, label in enumerate(labels)}
+    return np.array([index.get(emotion, -1) for emotion in emotions], dtype=np.intp)
+
+def emotion_scores(texts, classifier, cache=None, emotions=TARGET_EMOTIONS):
+    """
+    Score texts on the target emotions as a float32 matrix, one row per text.
+
+    Empty texts, and emotions the model has no label for, score 0.
+    """
+    texts = pd.Series(texts, dtype=object).reset_index(drop=True)
+    valid = (texts.notna() & texts.astype(str).str.strip().ne('')).to_numpy()
+    scores = np.zeros((len(texts), len(emotions)), dtype=np.float32)
+    if valid.any():
+        columns = target_columns(classifier.labels, emotions)
+        present = columns >= 0
+        probabilities = score_texts(classifier, texts[valid].astype(str).tolist(), cache)
+        scores[np.ix_(valid, present)] = probabilities[:, columns[present]]
+    return scores
+
+def dominant_emotion(scores, emotions=TARGET_EMOTIONS):
+    """Highest-scoring emotion per row (first on ties), 'neutral' when no emotion scores above 0"""
+    best = scores.argmax(axis=1)
+    return np.where(scores.max(axis=1, initial=0) > 0, np.asarray(emotions, dtype=object)[best], 'neutral')
+
+def emotion_flags(scores, threshold):
+    """Boolean matrix of the emotions whose score reaches the threshold"""
+    return scores >= threshold
+
+def add_emotion_columns(df, scores, threshold, emotions=TARGET_EMOTIONS):
+    """Return df with a column per emotion score, dominant_emotion and one flag per emotion"""
+    index = df.index
+    columns = pd.concat([
+        pd.DataFrame(scores, columns=list(emotions), index=index),
+        pd.DataFrame({'dominant_emotion': pd.Categorical(dominant_emotion(scores, emotions))}, index=index),
+        pd.DataFrame(emotion_flags(scores, threshold), columns=[f"{emotion}_flag" for emotion in emotions], index=index),
+    ], axis=1)
+    return pd.concat([df.drop(columns=columns.columns, errors='ignore'), columns], axis=1)
+
+def emotion_arrow_schema():
+    schema = review_arrow_schema(REVIEW_COLUMNS)
+    for emotion in TARGET_EMOTIONS:
+        schema = schema.append(pa.field(emotion, pa.float32()))
+    schema = schema.append(pa.field('dominant_emotion', pa.dictionary(pa.int32(), pa.string())))
+    for column in FLAG_COLUMNS:
+        schema = schema.append(pa.field(column, pa.bool_()))
+    return schema
+
+def run_emotion_stage(config=None, input_path=INPUT_PATH, output_path=OUTPUT_PATH):
+    """Score the aggregated reviews and write them with emotion columns; returns success"""
+    config = {**DEFAULT_EMOTION_CONFIG, **(config or {})}
+    if not dataset_exists(input_path):
+        logger.error(f"No aggregated review data found at {input_path}")
+        return False
+
+    classifier = TextClassifier(
+        MODEL_ID, batch_size=config['batch_size'], max_length=config['max_length'], num_threads=config['num_threads']
+    )
+    cache = InferenceCache() if config['use_cache'] else None
+    start = time.monotonic()
+    scored = 0
+
+    def chunks():
+        nonlocal scored
+        for chunk in iter_dataset(input_path, config['chunk_size'], columns=REVIEW_COLUMNS):
+            chunk = apply_review_schema(chunk, REVIEW_COLUMNS)
+            scores = emotion_scores(chunk['review'], classifier, cache)
+            scored += len(chunk)
+            logger.info(f"Emotions scored for {scored} reviews ({scored / (time.monotonic() - start):.0f} reviews/s)")
+            yield add_emotion_columns(chunk, scores, config['threshold'])[OUTPUT_COLUMNS]
+
+    # A failure aborts the write rather than writing zero scores that would read as 'neutral'
+    output_path = Path(output_path)
+    try:
+        rows = write_chunks(chunks(), output_path, output_path.with_suffix('.csv'), emotion_arrow_schema())
+    except Exception as e:
+        logger.error(f"Emotion scoring failed after {scored} reviews; {output_path} was not updated: {e}")
+        return False
+    logger.info(f"Wrote {rows} reviews with emotions to {output_path} in {time.monotonic() - start:.1f}s")
+    logger.info(
+        f"{classifier.rows_requested} texts, {classifier.unique_texts} unique (dedup ratio {classifier.dedup_ratio:.1%}); "
+        f"{classifier.texts_scored} scored by the model in {classifier.forward_passes} forward passes"
+    )
+    return True
+
+def main(argv=None):
+    import yaml
+    with open(Path(__file__).parent.parent / 'config' / 'config.yaml', 'r') as file:
+        config = (yaml.safe_load(file) or {}).get('emotion') or {}
+    return 0 if run_emotion_stage(config) else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Batched CPU inference for the Hugging Face text classifiers used on the reviews.
+
+Texts are tokenized once, sorted by token length and split into batches of similar
+length, so each forward pass pads as little as possible. torch and transformers are
+imported when a model is first loaded, so modules using this stay cheap to import.
+
+score_texts puts deduplication and the inference cache in front of a classifier:
+each distinct normalized text is scored once per call, and only texts never scored
+before reach the model.
+"""
+
+import time
+import hashlib
+import logging
+import unicodedata
+import numpy as np
+from scoring.cache import label_set_key
+
+logger = logging.getLogger('scoring')
+
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_LENGTH = 512
+
+def configure_threads(num_threads):
+    """Set the number of CPU threads torch uses for inference"""
+    import torch
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+    logger.info(f"Running inference on CPU with {torch.get_num_threads()} threads")
+
+def length_buckets(lengths, batch_size):
+    """Split row indices into batches of similar token length, shortest first"""
+    order = np.argsort(np.asarray(lengths), kind='stable')
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+class TextClassifier:
+    """
+    A sequence-classification model scored in length-bucketed batches.
+
+    predict_proba returns a float32 matrix of label probabilities, one row per text,
+    with columns in the model's label order (see labels).
+    """
+
+    def __init__(self, model_id, batch_size=DEFAULT_BATCH_SIZE, max_length=DEFAULT_MAX_LENGTH,
+                 num_threads=None, activation='softmax'):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.num_threads = num_threads
+        self.activation = activation
+        self._tokenizer = None
+        self._model = None
+        self._config = None
+        self.forward_passes = 0
+        self.texts_scored = 0
+        self.rows_requested = 0
+        self.unique_texts = 0
+
+    def load(self):
+        if self._model is None:
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            configure_threads(self.num_threads)
+            logger.info(f"Loading model {self.model_id}")
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            self._model = AutoModelForSequenceClassification.from_pretrained(self.model_id).eval()
+        return self
+
+    @property
+    def labels(self):
+        """Label names in column order of predict_proba (read from the config, without loading weights)"""
+        if self._config is None:
+            if self._model is not None:
+                self._config = self._model.config
+            else:
+                from transformers import AutoConfig
+                self._config = AutoConfig.from_pretrained(self.model_id)
+        id2label = self._config.id2label
+        return [id2label[i] for i in range(len(id2label))]
+
+    @property
+    def dedup_ratio(self):
+        """Share of rows passed to score_texts that were duplicates of another row in the batch"""
+        return 1 - self.unique_texts / self.rows_requested if self.rows_requested else 0.0
+
+    def predict_proba(self, texts):
+        import torch
+        self.load()
+        texts = list(texts)
+        probabilities = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        if not texts:
+            return probabilities
+
+        start = time.monotonic()
+        encoded = self._tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded['input_ids']]
+        padded_tokens = 0
+
+        with torch.inference_mode():
+            for batch in length_buckets(lengths, self.batch_size):
+                features = self._tokenizer.pad(
+                    {key: [encoded[key][i] for i in batch] for key in encoded.keys()},
+                    return_tensors='pt'
+                )
+                logits = self._model(**features).logits.float()
+                scores = torch.sigmoid(logits) if self.activation == 'sigmoid' else torch.softmax(logits, dim=-1)
+                probabilities[batch] = scores.numpy()
+                padded_tokens += features['input_ids'].numel()
+                self.forward_passes += 1
+
+        self.texts_scored += len(texts)
+        elapsed = time.monotonic() - start
+        logger.info(
+            f"{self.model_id}: scored {len(texts)} texts in {elapsed:.1f}s ({len(texts) / max(elapsed, 1e-9):.0f} texts/s), "
+            f"padding overhead {padded_tokens / max(sum(lengths), 1) - 1:.1%}"
+        )
+        return probabilities
+
+def normalize_text(text):
+    """Canonical form of a review for hashing and inference: NFKC, whitespace collapsed"""
+    return ' '.join(unicodedata.normalize('NFKC', str(text)).split())
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def score_texts(classifier, texts, cache=None, label_set=None):
+    """
+    Score texts with a classifier, once per distinct normalized text.
+
+    Identical texts are collapsed before the cache lookup and inference, and the scores
+    scattered back to every row. label_set identifies what the scores depend on besides
+    the model (defaults to the model's labels). Returns a float32 matrix with one row
+    per text.
+    """
+    normalized = [normalize_text(text) for text in texts]
+    if not normalized:
+        return np.zeros((0, len(classifier.labels)), dtype=np.float32)
+
+    texts = list(dict.fromkeys(normalized))
+    positions = {text: i for i, text in enumerate(texts)}
+    rows = np.fromiter((positions[text] for text in normalized), dtype=np.intp, count=len(normalized))
+
+    classifier.rows_requested += len(normalized)
+    classifier.unique_texts += len(texts)
+    logger.info(f"{classifier.model_id}: {len(texts)} unique of {len(normalized)} texts "
+                f"(dedup ratio {1 - len(texts) / len(normalized):.1%})")
+    return _score_unique(classifier, texts, cache, label_set)[rows]
+
+def _score_unique(classifier, texts, cache, label_set):
+    if cache is None:
+        return classifier.predict_proba(texts)
+
+    label_set = label_set_key(label_set if label_set is not None else classifier.labels)
+    hashes = [text_hash(text) for text in texts]
+    cached = cache.get_many(classifier.model_id, label_set, hashes)
+    missing = [i for i, digest in enumerate(hashes) if digest not in cached]
+    logger.info(f"{classifier.model_id}: {len(texts) - len(missing)} of {len(texts)} texts served from the inference cache")
+
+    if missing:
+        scores = classifier.predict_proba([texts[i] for i in missing])
+        cache.put_many(classifier.model_id, label_set, {hashes[i]: scores[row] for row, i in enumerate(missing)})
+    else:
+        scores = None
+
+    width = scores.shape[1] if scores is not None else len(next(iter(cached.values())))
+    probabilities = np.empty((len(texts), width), dtype=np.float32)
+    for i, digest in enumerate(hashes):
+        if digest in cached:
+            probabilities[i] = cached[digest]
+    if missing:
+        probabilities[missing] = scores
+    return probabilities
@@ -0,0 +1,102 @@
+"""
+Sentiment stage: labels every aggregated review Negative, Neutral or Positive.
+
+Replaces the per-row pipeline call in notebooks/Sentiment_Analysis.ipynb. The aggregate
+is read and written chunk by chunk, each chunk scored in length-bucketed batches.
+Run after aggregation, or on its own with:
+
+    python -m scoring.sentiment
+"""
+
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from etl_scripts.storage import iter_dataset, dataset_exists, write_chunks
+from etl_scripts.schema import REVIEW_COLUMNS, apply_review_schema, review_arrow_schema
+from scoring.engine import TextClassifier, score_texts, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from scoring.cache import InferenceCache
+
+logger = logging.getLogger('sentiment')
+
+MODEL_ID = "cardiffnlp/twitter-roberta-base-sentiment"
+
+# The model reports LABEL_0..LABEL_2
+LABELS = ["Negative", "Neutral", "Positive"]
+
+OUTPUT_COLUMNS = REVIEW_COLUMNS + ['sentiment']
+
+DEFAULT_SENTIMENT_CONFIG = {
+    'enabled': True,
+    'batch_size': DEFAULT_BATCH_SIZE,
+    'max_length': DEFAULT_MAX_LENGTH,
+    'num_threads': None,   # torch default (all cores)
+    'chunk_size': 5000,    # rows scored and written at a time
+    'use_cache': True,     # reuse scores of reviews seen in earlier runs
+}
+
+aggregate_dir = Path(__file__).parent.parent / 'aggregate'
+INPUT_PATH = aggregate_dir / 'combined_review_data.parquet'
+OUTPUT_PATH = aggregate_dir / 'combined_review_data_with_sentiment.parquet'
+
+def classify_sentiment(texts, classifier, cache=None):
+    """Return a sentiment label per text; empty texts are Neutral, as in the notebook"""
+    texts = pd.Series(texts, dtype=object).reset_index(drop=True)
+    valid = (texts.notna() & texts.astype(str).str.strip().ne('')).to_numpy()
+    labels = np.full(len(texts), "Neutral", dtype=object)
+    if valid.any():
+        probabilities = score_texts(classifier, texts[valid].astype(str).tolist(), cache)
+        labels[valid] = np.asarray(LABELS, dtype=object)[probabilities.argmax(axis=1)]
+    return labels
+
+def run_sentiment_stage(config=None, input_path=INPUT_PATH, output_path=OUTPUT_PATH):
+    """Score the aggregated reviews and write them with a sentiment column; returns success"""
+    config = {**DEFAULT_SENTIMENT_CONFIG, **(config or {})}
+    if not dataset_exists(input_path):
+        logger.error(f"No aggregated review data found at {input_path}")
+        return False
+
+    classifier = TextClassifier(
+        MODEL_ID, batch_size=config['batch_size'], max_length=config['max_length'], num_threads=config['num_threads']
+    )
+    cache = InferenceCache() if config['use_cache'] else None
+    start = time.monotonic()
+    scored = 0
+
+    def chunks():
+        nonlocal scored
+        for chunk in iter_dataset(input_path, config['chunk_size'], columns=REVIEW_COLUMNS):
+            chunk = apply_review_schema(chunk, REVIEW_COLUMNS)
+            chunk['sentiment'] = classify_sentiment(chunk['review'], classifier, cache)
+            scored += len(chunk)
+            logger.info(f"Sentiment scored for {scored} reviews ({scored / (time.monotonic() - start):.0f} reviews/s)")
+            yield apply_review_schema(chunk, OUTPUT_COLUMNS)
+
+    # A failure (including the model failing to load) aborts the write, so the previous
+    # output stays in place and the stage is reported as failed
+    output_path = Path(output_path)
+    try:
+        rows = write_chunks(chunks(), output_path, output_path.with_suffix('.csv'), review_arrow_schema(OUTPUT_COLUMNS))
+    except Exception as e:
+        logger.error(f"Sentiment scoring failed after {scored} reviews; {output_path} was not updated: {e}")
+        return False
+    logger.info(f"Wrote {rows} reviews with sentiment to {output_path} in {time.monotonic() - start:.1f}s")
+    logger.info(
+        f"{classifier.rows_requested} texts, {classifier.unique_texts} unique (dedup ratio {classifier.dedup_ratio:.1%}); "
+        f"{classifier.texts_scored} scored by the model in {classifier.forward_passes} forward passes"
+    )
+    if cache is not None:
+        logger.info(f"Inference cache: {cache.hits} hits, {cache.misses} misses")
+    return True
+
+def main(argv=None):
+    import yaml
+    with open(Path(__file__).parent.parent / 'config' / 'config.yaml', 'r') as file:
+        config = (yaml.safe_load(file) or {}).get('sentiment') or {}
+    return 0 if run_sentiment_stage(config) else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
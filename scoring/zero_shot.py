@@ -0,0 +1,316 @@
+"""
+Zero-shot topic labels for the reviews with an NLI model (facebook/bart-large-mnli).
+
+Replaces the zero-shot pipeline calls in notebooks/Zero_Shot_Classification.ipynb,
+which tokenize and pad every (review, label) pair on its own. Here each review and
+each label hypothesis is tokenized once, and the pairs are assembled from token ids
+and scored in batches that hold all hypotheses of reviews of similar length.
+Scores match the pipeline's multi_label=True: entailment vs contradiction per label.
+
+BART reads premise and hypothesis jointly, so the forward pass itself cannot be
+shared between labels. The fast mode therefore ranks labels by embedding similarity
+to the review and re-scores only the top_k with the NLI model, cutting the passes
+from reviews x labels to reviews x top_k. Run on the sentiment output with:
+
+    python -m scoring.zero_shot
+"""
+
+import sys
+import copy
+import time
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pathlib import Path
+from etl_scripts.storage import iter_dataset, dataset_exists, write_chunks
+from etl_scripts.schema import REVIEW_COLUMNS, apply_review_schema, review_arrow_schema
+from scoring.engine import TextClassifier, score_texts, length_buckets, DEFAULT_BATCH_SIZE, DEFAULT_MAX_LENGTH
+from scoring.cache import InferenceCache
+
+logger = logging.getLogger('zero_shot')
+
+MODEL_ID = "facebook/bart-large-mnli"
+EMBEDDING_MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+HYPOTHESIS_TEMPLATE = "This example is {}."
+
+# Candidate labels for the reviews of each sentiment
+LABEL_SETS = {
+    'Negative': [
+        "late delivery", "cold food", "missing items", "high fees", "incorrect order",
+        "unresponsive customer service", "app crashes", "canceled order", "payment issues",
+        "driver issues", "tracking problems", "refund problems", "bad packaging",
+        "order never arrived", "overpriced", "poor restaurant selection", "damaged items",
+        "long wait times", "hygiene concerns", "expired promotions", "account issues"
+    ],
+    'Positive': [
+        "fast delivery", "good customer service", "accurate order", "food quality",
+        "reasonable prices", "wide restaurant selection", "easy to use", "helpful tracking",
+        "good discounts", "reliable service", "friendly drivers", "good packaging",
+        "order accuracy", "quick refunds", "accommodating special requests",
+        "subscription benefits", "contactless delivery", "transparent pricing"
+    ],
+    'Neutral': [
+        "average delivery time", "expected service", "minor issues", "feature suggestions",
+        "mixed experiences", "inconsistent service", "new app version", "occasional delays",
+        "typical for delivery apps", "standard packaging", "common delivery experience",
+        "reasonable for price point", "depends on restaurant", "driver tipping feedback"
+    ],
+}
+
+INPUT_COLUMNS = REVIEW_COLUMNS + ['sentiment']
+OUTPUT_COLUMNS = INPUT_COLUMNS + ['top_label', 'top_score']
+
+DEFAULT_ZERO_SHOT_CONFIG = {
+    'mode': 'nli',         # 'nli' scores every label, 'fast' re-ranks the top_k by embedding similarity
+    'top_k': 3,
+    'batch_size': DEFAULT_BATCH_SIZE,   # (review, label) pairs per forward pass
+    'max_length': DEFAULT_MAX_LENGTH,
+    'num_threads': None,   # torch default (all cores)
+    'chunk_size': 5000,    # rows scored and written at a time
+    'use_cache': True,     # reuse scores of reviews seen in earlier runs
+}
+
+aggregate_dir = Path(__file__).parent.parent / 'aggregate'
+INPUT_PATH = aggregate_dir / 'combined_review_data_with_sentiment.parquet'
+OUTPUT_PATH = aggregate_dir / 'combined_review_data_with_topics.parquet'
+
+class SentenceEmbedder:
+    """Mean-pooled, L2-normalized sentence embeddings, computed in length-bucketed batches"""
+
+    def __init__(self, model_id=EMBEDDING_MODEL_ID, batch_size=DEFAULT_BATCH_SIZE, max_length=256):
+        self.model_id = model_id
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._tokenizer = None
+        self._model = None
+
+    def load(self):
+        if self._model is None:
+            from transformers import AutoTokenizer, AutoModel
+            logger.info(f"Loading embedding model {self.model_id}")
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_id)
+            self._model = AutoModel.from_pretrained(self.model_id).eval()
+        return self
+
+    def encode(self, texts):
+        import torch
+        self.load()
+        texts = list(texts)
+        encoded = self._tokenizer(texts, truncation=True, max_length=self.max_length)
+        embeddings = np.zeros((len(texts), self._model.config.hidden_size), dtype=np.float32)
+        with torch.inference_mode():
+            for batch in length_buckets([len(ids) for ids in encoded['input_ids']], self.batch_size):
+                features = self._tokenizer.pad(
+                    {key: [encoded[key][i] for i in batch] for key in encoded.keys()},
+                    return_tensors='pt'
+                )
+                hidden = self._model(**features).last_hidden_state
+                mask = features['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                embeddings[batch] = torch.nn.functional.normalize(pooled, dim=-1).numpy()
+        return embeddings
+
+class ZeroShotClassifier(TextClassifier):
+    """
+    NLI zero-shot classifier over a fixed list of candidate labels.
+
+    predict_proba returns the entailment probability of each label (multi-label, as
+    the pipeline's multi_label=True), one row per text. In fast mode, labels outside
+    a text's top_k by embedding similarity score 0.
+    """
+
+    def __init__(self, labels, model_id=MODEL_ID, mode='nli', top_k=3, embedding_model_id=EMBEDDING_MODEL_ID,
+                 hypothesis_template=HYPOTHESIS_TEMPLATE, batch_size=DEFAULT_BATCH_SIZE,
+                 max_length=DEFAULT_MAX_LENGTH, num_threads=None):
+        super().__init__(model_id, batch_size=batch_size, max_length=max_length, num_threads=num_threads)
+        if mode not in ('nli', 'fast'):
+            raise ValueError(f"Unknown zero-shot mode: {mode}")
+        self.candidate_labels = list(labels)
+        self.mode = mode
+        self.top_k = top_k
+        self.hypothesis_template = hypothesis_template
+        self._embedder = SentenceEmbedder(embedding_model_id, batch_size) if mode == 'fast' else None
+        self._hypothesis_ids = None
+        self._label_embeddings = None
+        self._shared = {}
+        self.pairs_scored = 0
+
+    def with_labels(self, labels):
+        """A classifier for other candidate labels that shares the loaded models"""
+        other = copy.copy(self)
+        other.candidate_labels = list(labels)
+        other._hypothesis_ids = None
+        other._label_embeddings = None
+        other.forward_passes = other.texts_scored = other.rows_requested = other.unique_texts = other.pairs_scored = 0
+        return other
+
+    @property
+    def labels(self):
+        return self.candidate_labels
+
+    @property
+    def label_set(self):
+        """Everything the scores depend on besides the model, for the inference cache"""
+        settings = [self.mode, self.hypothesis_template]
+        if self.mode == 'fast':
+            settings += [self._embedder.model_id, self.top_k]
+        return settings + self.candidate_labels
+
+    def load(self):
+        # Copies made by with_labels load the models once, through the shared dict
+        if not self._shared:
+            super().load()
+            self._shared.update(tokenizer=self._tokenizer, model=self._model)
+        self._tokenizer, self._model = self._shared['tokenizer'], self._shared['model']
+        if self._hypothesis_ids is None:
+            hypotheses = [self.hypothesis_template.format(label) for label in self.candidate_labels]
+            self._hypothesis_ids = self._tokenizer(hypotheses, add_special_tokens=False)['input_ids']
+            if self._embedder is not None:
+                self._label_embeddings = self._embedder.encode(self.candidate_labels)
+        return self
+
+    def predict_proba(self, texts):
+        self.load()
+        texts = list(texts)
+        scores = np.zeros((len(texts), len(self.candidate_labels)), dtype=np.float32)
+        if not texts:
+            return scores
+
+        # Premises are tokenized once, truncated so the longest hypothesis still fits
+        budget = (self.max_length - self._tokenizer.num_special_tokens_to_add(pair=True)
+                  - max(len(ids) for ids in self._hypothesis_ids))
+        premise_ids = self._tokenizer(texts, add_special_tokens=False, truncation=True, max_length=budget)['input_ids']
+
+        candidates = None
+        if self.mode == 'fast' and 0 < self.top_k < len(self.candidate_labels):
+            similarity = self._embedder.encode(texts) @ self._label_embeddings.T
+            candidates = np.argpartition(-similarity, self.top_k - 1, axis=1)[:, :self.top_k]
+
+        self._score_pairs(premise_ids, candidates, scores)
+        self.texts_scored += len(texts)
+        return scores
+
+    def _score_pairs(self, premise_ids, candidates, scores):
+        """Fill scores with entailment probabilities of each premise's candidate labels"""
+        import torch
+        label2id = {label.lower(): i for label, i in self._model.config.label2id.items()}
+        columns = [label2id['contradiction'], label2id['entailment']]
+        all_labels = np.arange(len(self.candidate_labels))
+
+        start = time.monotonic()
+        pairs = 0
+        padded_tokens = 0
+        token_count = 0
+        batch = []
+
+        def flush():
+            nonlocal padded_tokens, token_count
+            input_ids = [
+                self._tokenizer.build_inputs_with_special_tokens(premise_ids[row], self._hypothesis_ids[label])
+                for row, label in batch
+            ]
+            features = self._tokenizer.pad({'input_ids': input_ids}, return_tensors='pt')
+            logits = self._model(**features).logits.float()
+            entailment = torch.softmax(logits[:, columns], dim=-1)[:, 1].numpy()
+            rows, labels = zip(*batch)
+            scores[list(rows), list(labels)] = entailment
+            padded_tokens += features['input_ids'].numel()
+            token_count += sum(len(ids) for ids in input_ids)
+            self.forward_passes += 1
+            batch.clear()
+
+        # Premises in length order, all hypotheses of a premise in the same or next batch
+        with torch.inference_mode():
+            for row in np.argsort([len(ids) for ids in premise_ids], kind='stable'):
+                for label in (candidates[row] if candidates is not None else all_labels):
+                    batch.append((row, label))
+                    pairs += 1
+                    if len(batch) >= self.batch_size:
+                        flush()
+            if batch:
+                flush()
+
+        self.pairs_scored += pairs
+        elapsed = time.monotonic() - start
+        logger.info(
+            f"{self.model_id}: scored {pairs} review/label pairs for {len(premise_ids)} reviews in {elapsed:.1f}s "
+            f"({pairs / max(elapsed, 1e-9):.0f} pairs/s), padding overhead {padded_tokens / max(token_count, 1) - 1:.1%}"
+        )
+
+def top_labels(scores, labels):
+    """Best label and its score per row"""
+    best = scores.argmax(axis=1)
+    return np.asarray(labels, dtype=object)[best], scores[np.arange(len(scores)), best]
+
+def classify_topics(df, classifiers, cache=None):
+    """Return (top_label, top_score) per row, using the candidate labels of each row's sentiment"""
+    texts = df['review'].astype(object).reset_index(drop=True)
+    sentiment = df['sentiment'].astype(object).reset_index(drop=True)
+    valid = texts.notna() & texts.astype(str).str.strip().ne('')
+    label = np.full(len(df), None, dtype=object)
+    score = np.full(len(df), np.nan, dtype=np.float32)
+    for value, classifier in classifiers.items():
+        rows = (valid & sentiment.eq(value)).to_numpy()
+        if rows.any():
+            scores = score_texts(classifier, texts[rows].astype(str).tolist(), cache, label_set=classifier.label_set)
+            label[rows], score[rows] = top_labels(scores, classifier.labels)
+    return label, score
+
+def zero_shot_arrow_schema():
+    schema = review_arrow_schema(INPUT_COLUMNS)
+    schema = schema.append(pa.field('top_label', pa.dictionary(pa.int32(), pa.string())))
+    return schema.append(pa.field('top_score', pa.float32()))
+
+def run_zero_shot_stage(config=None, input_path=INPUT_PATH, output_path=OUTPUT_PATH):
+    """Label the reviews with the sentiment's candidate topics; returns success"""
+    config = {**DEFAULT_ZERO_SHOT_CONFIG, **(config or {})}
+    if not dataset_exists(input_path):
+        logger.error(f"No review data with sentiment found at {input_path}")
+        return False
+
+    base = ZeroShotClassifier(
+        [], mode=config['mode'], top_k=config['top_k'], batch_size=config['batch_size'],
+        max_length=config['max_length'], num_threads=config['num_threads']
+    )
+    classifiers = {sentiment: base.with_labels(labels) for sentiment, labels in LABEL_SETS.items()}
+    cache = InferenceCache() if config['use_cache'] else None
+    start = time.monotonic()
+    scored = 0
+
+    def chunks():
+        nonlocal scored
+        for chunk in iter_dataset(input_path, config['chunk_size'], columns=INPUT_COLUMNS):
+            chunk = apply_review_schema(chunk, INPUT_COLUMNS)
+            label, score = classify_topics(chunk, classifiers, cache)
+            chunk['top_label'] = pd.Categorical(label)
+            chunk['top_score'] = score
+            scored += len(chunk)
+            logger.info(f"Zero-shot labels for {scored} reviews ({scored / (time.monotonic() - start):.0f} reviews/s)")
+            yield chunk[OUTPUT_COLUMNS]
+
+    # A failure aborts the write, so the previous output stays in place
+    output_path = Path(output_path)
+    try:
+        rows = write_chunks(chunks(), output_path, output_path.with_suffix('.csv'), zero_shot_arrow_schema())
+    except Exception as e:
+        logger.error(f"Zero-shot labelling failed after {scored} reviews; {output_path} was not updated: {e}")
+        return False
+    logger.info(f"Wrote {rows} reviews with zero-shot labels to {output_path} in {time.monotonic() - start:.1f}s")
+    for sentiment, classifier in classifiers.items():
+        logger.info(
+            f"{sentiment}: {classifier.rows_requested} texts, {classifier.unique_texts} unique, "
+            f"{classifier.texts_scored} scored with {classifier.pairs_scored} review/label pairs "
+            f"in {classifier.forward_passes} forward passes"
+        )
+    return True
+
+def main(argv=None):
+    import yaml
+    with open(Path(__file__).parent.parent / 'config' / 'config.yaml', 'r') as file:
+        config = (yaml.safe_load(file) or {}).get('zero_shot') or {}
+    return 0 if run_zero_shot_stage(config) else 1
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import tempfile
+import unittest
+import pandas as pd
+from pathlib import Path
+from pipeline.aggregate import aggregate_incremental
+
+APPS = [{'app_name': 'DoorDash', 'app_path': 'doordash'}, {'app_name': 'Uber Eats', 'app_path': 'ubereats'}]
+
+def write_combined(data_dir, app_path, reviews):
+    path = data_dir / app_path / 'processed_data' / 'combined_reviews.csv'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({
+        'review': reviews, 'review_datetime': '2025-01-01 12:00:00', 'data_source': 'google_play',
+        'app_name': app_path, 'upvote_count': 0, 'total_comments': 0, 'app_rating': 4,
+    }).to_csv(path, index=False)
+    return path
+
+class AggregatePartitionsTest(unittest.TestCase):
+
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        self.data_dir, self.aggregate_dir = root / 'data', root / 'aggregate'
+        self.partitions_dir = self.aggregate_dir / 'partitions'
+        write_combined(self.data_dir, 'doordash', ['late', 'cold'])
+        self.ubereats = write_combined(self.data_dir, 'ubereats', ['great'])
+        self.assertEqual(aggregate_incremental(APPS, self.data_dir, self.aggregate_dir),
+                         (3, {'DoorDash': 2, 'Uber Eats': 1}))
+
+    def combined_apps(self):
+        return sorted(pd.read_parquet(self.aggregate_dir / 'combined_review_data.parquet')['app_name'].unique())
+
+    def test_configured_app_missing_its_input_keeps_its_partition(self):
+        self.ubereats.unlink()
+        with self.assertLogs('aggregate', level='WARNING'):
+            self.assertEqual(aggregate_incremental(APPS, self.data_dir, self.aggregate_dir), (2, {'DoorDash': 2}))
+        self.assertEqual(self.combined_apps(), ['DoorDash'])
+        self.assertTrue((self.partitions_dir / 'ubereats.parquet').exists())
+
+        # Once the data is back, the kept partition is reused rather than rebuilt
+        write_combined(self.data_dir, 'ubereats', ['great'])
+        with self.assertLogs('aggregate', level='INFO') as logs:
+            self.assertEqual(aggregate_incremental(APPS, self.data_dir, self.aggregate_dir),
+                             (3, {'DoorDash': 2, 'Uber Eats': 1}))
+        self.assertTrue(any('Uber Eats: input unchanged' in line for line in logs.output))
+        self.assertEqual(self.combined_apps(), ['DoorDash', 'Uber Eats'])
+
+    def test_unconfigured_app_loses_its_partition(self):
+        self.assertEqual(aggregate_incremental(APPS[:1], self.data_dir, self.aggregate_dir), (2, {'DoorDash': 2}))
+        self.assertEqual(self.combined_apps(), ['DoorDash'])
+        self.assertFalse((self.partitions_dir / 'ubereats.parquet').exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import re
+import sys
+import unittest
+import importlib
+from types import ModuleType, SimpleNamespace
+
+# The search helpers don't touch the Reddit client libraries, so stand in for any that aren't installed
+for name, attributes in {
+    'asyncpraw': {},
+    'asyncprawcore': {'Requestor': object},
+    'dotenv': {'load_dotenv': lambda *args, **kwargs: None},
+}.items():
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+from etl_scripts.reddit_etl import format_search_clause, plan_search_queries, match_search_terms
+
+def post(title, selftext='', is_self=True):
+    return SimpleNamespace(title=title, selftext=selftext, is_self=is_self)
+
+def per_term_search(term, submission):
+    """What a single-term search used to return a submission for: title (and selftext of
+    self posts), each word matching a word's prefix, quoted phrases as adjacent words"""
+    words = re.findall(r'\w+', f"{submission.title} {submission.selftext if submission.is_self else ''}".lower())
+    term_words = re.findall(r'\w+', term.lower())
+    if term.startswith('"'):
+        return any(
+            all(words[start + i].startswith(word) for i, word in enumerate(term_words))
+            for start in range(len(words) - len(term_words) + 1)
+        )
+    return all(any(w.startswith(word) for w in words) for word in term_words)
+
+class FormatSearchClauseTest(unittest.TestCase):
+
+    def test_single_words_and_phrases_are_unchanged(self):
+        self.assertEqual(format_search_clause('refund'), 'refund')
+        self.assertEqual(format_search_clause('"customer service"'), '"customer service"')
+        self.assertEqual(format_search_clause('flair:Complaint'), 'flair:Complaint')
+
+    def test_multi_word_terms_are_grouped(self):
+        self.assertEqual(format_search_clause('customer service'), '(customer service)')
+        self.assertEqual(format_search_clause('never again'), '(never again)')
+
+class PlanSearchQueriesTest(unittest.TestCase):
+
+    def test_packs_terms_into_one_query(self):
+        plans = plan_search_queries(['late', 'customer service', '"cold food"'])
+        self.assertEqual(plans, [('late OR (customer service) OR "cold food"', ['late', 'customer service', '"cold food"'])])
+
+    def test_splits_at_max_query_length(self):
+        terms = ['delivery', 'refund', 'customer service', 'driver', '"wrong order"']
+        plans = plan_search_queries(terms, max_query_length=30)
+        self.assertEqual(plans, [
+            ('delivery OR refund', ['delivery', 'refund']),
+            ('(customer service) OR driver', ['customer service', 'driver']),
+            ('"wrong order"', ['"wrong order"']),
+        ])
+        for query, _ in plans:
+            self.assertLessEqual(len(query), 30)
+
+    def test_term_longer_than_the_limit_gets_its_own_query(self):
+        plans = plan_search_queries(['late', 'a very long multi word term'], max_query_length=10)
+        self.assertEqual(plans, [('late', ['late']), ('(a very long multi word term)', ['a very long multi word term'])])
+
+    def test_splits_at_max_terms_per_query(self):
+        terms = ['a', 'b', 'c', 'd', 'e']
+        plans = plan_search_queries(terms, max_terms_per_query=2)
+        self.assertEqual([batch for _, batch in plans], [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual([query for query, _ in plans], ['a OR b', 'c OR d', 'e'])
+
+    def test_every_term_planned_once_in_order(self):
+        terms = ['map', 'late', 'map', 'customer service', 'late', '"app issues"']
+        plans = plan_search_queries(terms, max_query_length=20, max_terms_per_query=2)
+        self.assertEqual([term for _, batch in plans for term in batch], ['map', 'late', 'customer service', '"app issues"'])
+
+class MatchSearchTermsTest(unittest.TestCase):
+
+    TERMS = [
+        'late', 'refund', 'deliver', 'app', 'map', 'tip', 'customer service', 'never again', 'picked up',
+        '"customer service"', '"cold food"', '"wrong order"', '"app issues"', '"not delivered"',
+    ]
+
+    SUBMISSIONS = [
+        post('Order was LATE again', 'Asked for a refund, never got one'),
+        post('Delivered to the wrong address', 'driver picked it up and left'),
+        post('Customer-service was useless', 'Never, ever again.'),
+        post('Got cold foods', 'wrong order and the app issues keep coming'),
+        post('Who should I tip?', 'The service from this customer was fine'),
+        post('Scold food', 'mapping the route; apple pay failed'),
+        post('Order not delivered', 'Link post text', is_self=False),
+        post('Wrong   order, not delivered'),
+        post('Nothing relevant here'),
+    ]
+
+    def test_matches_same_terms_as_per_term_search(self):
+        for submission in self.SUBMISSIONS:
+            with self.subTest(title=submission.title):
+                expected = [term for term in self.TERMS if per_term_search(term, submission)]
+                self.assertEqual(match_search_terms(submission, self.TERMS), expected)
+
+    def test_examples(self):
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[0], self.TERMS), ['late', 'refund', 'never again'])
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[2], self.TERMS),
+                         ['customer service', 'never again', '"customer service"'])
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[4], self.TERMS), ['tip', 'customer service'])
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[5], self.TERMS), ['app', 'map'])
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[6], self.TERMS), ['deliver', '"not delivered"'])
+        self.assertEqual(match_search_terms(self.SUBMISSIONS[8], self.TERMS), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import sys
+import json
+import tempfile
+import unittest
+import importlib
+from pathlib import Path
+from types import ModuleType
+
+# The sync logic runs against LocalS3Client, so stand in for the AWS libraries when they aren't installed
+for name, attributes in {
+    'boto3': {},
+    'boto3.s3': {},
+    'boto3.s3.transfer': {'TransferConfig': dict},
+    'botocore': {},
+    'botocore.config': {'Config': dict},
+    'botocore.exceptions': {'ClientError': type('ClientError', (Exception,), {})},
+    'dotenv': {'load_dotenv': lambda *args, **kwargs: None},
+}.items():
+    try:
+        importlib.import_module(name)
+    except ImportError:
+        module = ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+from etl_scripts.s3_backup import LocalS3Client, sync_to_s3, restore_backup, MANIFEST_KEY
+
+BUCKET = 'reviews-backup'
+
+class SyncToS3Test(unittest.TestCase):
+
+    def setUp(self):
+        root = Path(tempfile.mkdtemp())
+        self.data_dir = root / 'data'
+        self.bucket_dir = root / 's3' / BUCKET
+        self.manifest_path = root / 's3_backup_manifest.json'
+        self.client = LocalS3Client(root / 's3')
+        self.files = {
+            'doordash/raw_data/reddit.csv': 'id,review\n1,late\n',
+            'doordash/processed_data/combined_reviews.csv': 'review\nlate\ncold\n',
+            'ubereats/raw_data/google_play.csv': 'id,review\n1,late\n',
+        }
+        for key, content in self.files.items():
+            self.write(key, content)
+
+    def write(self, key, content):
+        path = self.data_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+    def jobs(self):
+        return [(str(path), path.relative_to(self.data_dir).as_posix())
+                for path in sorted(self.data_dir.rglob('*')) if path.is_file()]
+
+    def sync(self, **kwargs):
+        return sync_to_s3(self.client, BUCKET, self.jobs(), manifest_path=self.manifest_path, workers=2, **kwargs)
+
+    def test_first_run_uploads_every_file(self):
+        self.assertEqual(self.sync(), 3)
+        for key, content in self.files.items():
+            self.assertEqual((self.bucket_dir / key).read_text(), content)
+        self.assertEqual(set(json.loads((self.bucket_dir / MANIFEST_KEY).read_text())['files']), set(self.files))
+
+    def test_unchanged_files_are_not_uploaded_again(self):
+        self.sync()
+        self.assertEqual(self.sync(), 0)
+
+        # The bucket's copy of the manifest is used when the local one is gone
+        self.manifest_path.unlink()
+        self.assertEqual(self.sync(), 0)
+
+    def test_changed_file_is_uploaded(self):
+        self.sync()
+        self.write('doordash/raw_data/reddit.csv', 'id,review\n1,late\n2,missing items\n')
+        self.assertEqual(self.sync(), 1)
+        self.assertIn('missing items', (self.bucket_dir / 'doordash/raw_data/reddit.csv').read_text())
+
+    def test_deleted_file_is_kept_without_delete_orphans(self):
+        self.sync()
+        (self.data_dir / 'ubereats/raw_data/google_play.csv').unlink()
+        self.assertEqual(self.sync(delete_orphans=False), 0)
+        self.assertTrue((self.bucket_dir / 'ubereats/raw_data/google_play.csv').exists())
+        self.assertIn('ubereats/raw_data/google_play.csv', json.loads(self.manifest_path.read_text())['files'])
+
+    def test_deleted_file_is_removed_with_delete_orphans(self):
+        self.sync()
+        (self.data_dir / 'ubereats/raw_data/google_play.csv').unlink()
+        self.assertEqual(self.sync(delete_orphans=True), 0)
+        self.assertFalse((self.bucket_dir / 'ubereats/raw_data/google_play.csv').exists())
+        self.assertNotIn('ubereats/raw_data/google_play.csv', json.loads(self.manifest_path.read_text())['files'])
+
+    def test_restore_backup_from_archive(self):
+        # Two of the files have the same content and share one blob
+        self.assertEqual(self.sync(mode='archive', compression='gzip'), 3)
+        self.assertEqual(len(list((self.bucket_dir / 'blobs').rglob('*.gz'))), 2)
+        self.assertEqual(self.sync(mode='archive', compression='gzip'), 0)
+
+        restore_dir = self.data_dir.parent / 'restored'
+        self.assertEqual(restore_backup(self.client, BUCKET, restore_dir), 3)
+        for key, content in self.files.items():
+            self.assertEqual((restore_dir / key).read_text(), content)
+
+    def test_restore_backup_skips_deleted_files(self):
+        self.sync(mode='archive', compression='gzip')
+        (self.data_dir / 'doordash/raw_data/reddit.csv').unlink()
+        self.sync(mode='archive', compression='gzip', delete_orphans=True)
+
+        restore_dir = self.data_dir.parent / 'restored'
+        self.assertEqual(restore_backup(self.client, BUCKET, restore_dir), 2)
+        self.assertFalse((restore_dir / 'doordash/raw_data/reddit.csv').exists())
+
+if __name__ == '__main__':
+    unittest.main()
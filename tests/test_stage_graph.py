@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+from pipeline.stage_graph import Stage, StageResult, resolve_dependencies, critical_path, run_stage_graph
+
+def succeed(delay=0.0):
+    async def func():
+        await asyncio.sleep(delay)
+        return True
+    return func
+
+async def fail():
+    return False
+
+class ResolveDependenciesTest(unittest.TestCase):
+
+    def test_maps_stages_to_producers(self):
+        stages = [
+            Stage('extract', succeed(), outputs=('raw',)),
+            Stage('combine', succeed(), inputs=('raw',), outputs=('combined',)),
+            Stage('aggregate', succeed(), inputs=('raw', 'combined')),
+        ]
+        self.assertEqual(resolve_dependencies(stages), {
+            'extract': [], 'combine': ['extract'], 'aggregate': ['combine', 'extract'],
+        })
+
+    def test_rejects_cycles(self):
+        stages = [
+            Stage('a', succeed(), inputs=('c_out',), outputs=('a_out',)),
+            Stage('b', succeed(), inputs=('a_out',), outputs=('b_out',)),
+            Stage('c', succeed(), inputs=('b_out',), outputs=('c_out',)),
+        ]
+        with self.assertRaisesRegex(ValueError, "Dependency cycle"):
+            resolve_dependencies(stages)
+
+    def test_rejects_missing_and_duplicate_producers(self):
+        with self.assertRaisesRegex(ValueError, "nobody produces"):
+            resolve_dependencies([Stage('a', succeed(), inputs=('missing',))])
+        with self.assertRaisesRegex(ValueError, "produced by both"):
+            resolve_dependencies([Stage('a', succeed(), outputs=('x',)), Stage('b', succeed(), outputs=('x',))])
+
+class RunStageGraphTest(unittest.TestCase):
+
+    def test_failed_input_skips_dependents_but_not_always_run(self):
+        stages = [
+            Stage('extract', fail, outputs=('raw',)),
+            Stage('other', succeed(), outputs=('other',)),
+            Stage('combine', succeed(), inputs=('raw',), outputs=('combined',)),
+            Stage('score', succeed(), inputs=('combined',)),
+            Stage('aggregate', succeed(), inputs=('raw', 'other'), always_run=True),
+        ]
+        with self.assertLogs('stage_graph', level='WARNING'):
+            results, _ = asyncio.run(run_stage_graph(stages))
+        self.assertEqual({name: result.status for name, result in results.items()}, {
+            'extract': 'FAILED', 'other': 'SUCCESS', 'combine': 'SKIPPED', 'score': 'SKIPPED', 'aggregate': 'SUCCESS',
+        })
+
+    def test_raising_stage_fails(self):
+        async def boom():
+            raise RuntimeError("network down")
+        with self.assertLogs('stage_graph', level='ERROR'):
+            results, _ = asyncio.run(run_stage_graph([Stage('extract', boom)]))
+        self.assertEqual(results['extract'].status, 'FAILED')
+
+    def test_group_semaphore_limits_concurrent_apps(self):
+        in_flight, peak = set(), [0]
+
+        def tracked(app):
+            async def func():
+                in_flight.add(app)
+                peak[0] = max(peak[0], len(in_flight))
+                await asyncio.sleep(0.01)
+                return True
+            return func
+
+        def done(app):
+            async def func():
+                await asyncio.sleep(0.01)
+                in_flight.discard(app)
+                return True
+            return func
+
+        stages = []
+        for app in ('doordash', 'ubereats', 'grubhub', 'instacart'):
+            stages.append(Stage(f'{app}_extract', tracked(app), outputs=(f'{app}_raw',), group=app))
+            stages.append(Stage(f'{app}_combine', done(app), inputs=(f'{app}_raw',), group=app))
+        results, _ = asyncio.run(run_stage_graph(stages, max_parallel_groups=2))
+
+        self.assertTrue(all(result.status == 'SUCCESS' for result in results.values()))
+        self.assertEqual(peak[0], 2)
+
+class CriticalPathTest(unittest.TestCase):
+
+    def test_longest_chain_by_elapsed_time(self):
+        dependencies = {'a': [], 'b': ['a'], 'c': [], 'd': ['b', 'c']}
+        results = {
+            name: StageResult(status='SUCCESS', start=0.0, end=seconds)
+            for name, seconds in {'a': 1.0, 'b': 2.0, 'c': 5.0, 'd': 0.5}.items()
+        }
+        self.assertEqual(critical_path(results, dependencies), (['c', 'd'], 5.5))
+
+    def test_skipped_stages_count_as_zero(self):
+        dependencies = {'a': [], 'b': ['a']}
+        results = {'a': StageResult(status='FAILED', start=0.0, end=1.0), 'b': StageResult(status='SKIPPED')}
+        self.assertEqual(critical_path(results, dependencies)[1], 1.0)
+
+    def test_run_stage_graph_reports_critical_path(self):
+        stages = [
+            Stage('slow', succeed(0.05), outputs=('slow_out',)),
+            Stage('fast', succeed(), outputs=('fast_out',)),
+            Stage('join', succeed(), inputs=('slow_out', 'fast_out')),
+        ]
+        _, (names, seconds) = asyncio.run(run_stage_graph(stages))
+        self.assertEqual(names, ['slow', 'join'])
+        self.assertGreaterEqual(seconds, 0.05)
+
+if __name__ == '__main__':
+    unittest.main()
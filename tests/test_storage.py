@@ -0,0 +1,70 @@
+import tempfile
+import unittest
+import pandas as pd
+from datetime import datetime, timedelta
+from pathlib import Path
+from etl_scripts.storage import save_parquet, load_dataset
+from etl_scripts.watermarks import merge_incremental
+
+GOOGLE_PLAY_COLUMNS = ['reviewId', 'userName', 'content', 'score', 'thumbsUpCount', 'at', 'replyContent', 'repliedAt']
+
+def scraper_row(review_id, at, replied_at=None):
+    return {'reviewId': review_id, 'userName': 'A Google user', 'content': 'late again', 'score': 1,
+            'thumbsUpCount': 0, 'at': at, 'replyContent': 'Sorry' if replied_at else None, 'repliedAt': replied_at}
+
+class MergeCsvWithScraperRowsTest(unittest.TestCase):
+    """An existing install's CSV merged with freshly scraped rows must still save as Parquet"""
+
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        now = datetime.now().replace(microsecond=0)
+        self.now = now
+        existing = pd.DataFrame([
+            scraper_row('old-1', now - timedelta(days=3), now - timedelta(days=2)),
+            scraper_row('old-2', now - timedelta(days=2)),
+            scraper_row('dup', now - timedelta(days=1)),
+        ], columns=GOOGLE_PLAY_COLUMNS)
+        existing.to_csv(self.dir / 'google_play.csv', index=False)
+
+    def test_google_play_merge_saves_with_datetime_columns(self):
+        fresh = pd.DataFrame([
+            scraper_row('new-1', self.now, self.now),
+            scraper_row('dup', self.now - timedelta(days=1), self.now),
+        ], columns=GOOGLE_PLAY_COLUMNS)
+        merged = merge_incremental(fresh, self.dir / 'google_play.csv', ['reviewId'], 'at')
+        self.assertEqual(sorted(merged['reviewId']), ['dup', 'new-1', 'old-1', 'old-2'])
+
+        path = save_parquet(merged, self.dir / 'google_play.csv')
+        saved = pd.read_parquet(path).set_index('reviewId')
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(saved['at']))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(saved['repliedAt']))
+        self.assertEqual(saved.loc['old-1', 'repliedAt'], self.now - timedelta(days=2))
+        self.assertEqual(saved.loc['dup', 'repliedAt'], self.now)
+        self.assertTrue(pd.isna(saved.loc['old-2', 'repliedAt']))
+
+    def test_next_run_merges_into_the_parquet_copy(self):
+        first = merge_incremental(pd.DataFrame([scraper_row('new-1', self.now, self.now)]),
+                                  self.dir / 'google_play.csv', ['reviewId'], 'at')
+        save_parquet(first, self.dir / 'google_play.csv')
+        second = merge_incremental(pd.DataFrame([scraper_row('new-2', self.now, self.now)]),
+                                   self.dir / 'google_play.csv', ['reviewId'], 'at')
+        save_parquet(second, self.dir / 'google_play.csv')
+        self.assertEqual(len(load_dataset(self.dir / 'google_play.csv')), 5)
+
+    def test_app_store_date_strings_and_datetimes(self):
+        pd.DataFrame({'date': [str(self.now - timedelta(days=1))], 'userName': ['a'], 'title': ['t'],
+                      'review': ['r'], 'rating': [3]}).to_csv(self.dir / 'app_store.csv', index=False)
+        fresh = pd.DataFrame({'date': [self.now], 'userName': ['b'], 'title': ['t'], 'review': ['r'], 'rating': [4],
+                              'developerResponse': [{'id': 1, 'body': 'Thanks', 'modified': self.now}]})
+        merged = merge_incremental(fresh, self.dir / 'app_store.csv', ['date', 'userName', 'title'], 'date', ascending=True)
+        saved = pd.read_parquet(save_parquet(merged, self.dir / 'app_store.csv'))
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(saved['date']))
+        self.assertIn('Thanks', saved['developerResponse'].dropna().iloc[0])
+
+    def test_reddit_date_strings_are_left_alone(self):
+        df = pd.DataFrame({'id': ['x'], 'date': ['2025-01-01'], 'timestamp_dt': [self.now]})
+        saved = pd.read_parquet(save_parquet(df, self.dir / 'reddit.csv'))
+        self.assertEqual(saved['date'].iloc[0], '2025-01-01')
+
+if __name__ == '__main__':
+    unittest.main()